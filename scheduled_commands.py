@@ -14,6 +14,19 @@ from django.core import management  # isort:skip
 def import_mobilize_america_events(*args, **kwargs):
     management.call_command("import_mobilize_america_events", **kwargs)
 
+
+# @telemetry.timed
+# @telemetry.report_exceptions(raise_exception=False)  # the next run will pick them up
+def flush_recommendation_logs(event, context):
+    management.call_command("flush_recommendation_logs")
+
+
+# @telemetry.timed
+# @telemetry.report_exceptions(raise_exception=False)  # the next run will pick them up
+def drain_signup_outbox(event, context):
+    management.call_command("drain_signup_outbox")
+
+
 # @telemetry.timed
 # @telemetry.report_exceptions  # allow this to retry
 def expire_assignments(event, context):
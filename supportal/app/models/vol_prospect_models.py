@@ -1,6 +1,7 @@
 import datetime
 import logging
 
+from django.conf import settings
 from django.contrib.postgres.fields import ArrayField, JSONField
 from django.db import models, transaction
 from django.db.models import FilteredRelation, Q
@@ -266,7 +267,11 @@ class VolProspectContactEvent(BaseModelMixin):
             ma_event_id=self.ma_event_id,
             ma_timeslot_ids=self.ma_timeslot_ids,
             source="switchboard",
+            ma_sync_deferred=settings.SHIFTER_SIGNUP_OUTBOX,
         )
+        if settings.SHIFTER_SIGNUP_OUTBOX:
+            # drain_signup_outbox will send it
+            return
         ma_creation_successful, ma_response = obj.sync_to_mobilize_america()
 
         if not ma_creation_successful:
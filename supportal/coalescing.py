@@ -0,0 +1,62 @@
+"""Share one call between identical concurrent callers, across processes
+
+The first caller takes a short lock in the cache and makes the call, the others
+poll the cache for its result. Results are cached as {"fetched_at", "value"}.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+
+# How long callers wait for another one's result before making the call
+# themselves
+WAIT_SECONDS = 5
+POLL_SECONDS = 0.05
+
+
+def store(key, value, timeout):
+    cache.set(key, {"fetched_at": time.time(), "value": value}, timeout)
+    return value
+
+
+def fetch_coalesced(
+    key,
+    fetch,
+    timeout,
+    wait_seconds=WAIT_SECONDS,
+    poll_seconds=POLL_SECONDS,
+    newer_only=False,
+):
+    """Call fetch() and cache its result for `timeout` seconds under key
+
+    Unless another caller is already fetching key, in which case wait up to
+    `wait_seconds` for their result. With `newer_only`, only results fetched
+    after we started waiting count. Exceptions raised by fetch aren't shared:
+    callers that were waiting on a failed fetch make the call themselves.
+    """
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, True, wait_seconds):
+        try:
+            return store(key, fetch(), timeout)
+        finally:
+            cache.delete(lock_key)
+
+    # The lock is checked before the result, so once it's gone the result is
+    # either there or never coming: their fetch failed, or the cache is
+    # unavailable and add() failed.
+    waiting_since = time.time()
+    deadline = waiting_since + wait_seconds
+    while True:
+        leader_done = cache.get(lock_key) is None
+        entry = cache.get(key)
+        if entry is not None and (
+            not newer_only or entry["fetched_at"] >= waiting_since
+        ):
+            return entry["value"]
+        if leader_done:
+            break
+        if time.time() >= deadline:
+            logging.warning(f"Timed out waiting for {key} to be cached, fetching it")
+            break
+        time.sleep(poll_seconds)
+    return store(key, fetch(), timeout)
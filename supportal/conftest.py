@@ -13,7 +13,17 @@ from rest_framework.test import APIClient
 
 from supportal.app.common.enums import CanvassResult
 from supportal.app.models import User
+from supportal.services.mobilize_america import (
+    clear_attendance_cache,
+    get_global_client,
+)
 from supportal.settings import BASE_DIR
+from supportal.shifter.caching import (
+    bump_event_cache_generation,
+    clear_ma_events_cache,
+    reset_state_prioritization_config,
+)
+from supportal.shifter.mobilize_america_helpers import zip5_centroid
 from supportal.shifter.models import USZip5
 from supportal.tests import utils
 from supportal.tests.baker_recipes import set_mobilize_america_event_raw
@@ -36,6 +46,17 @@ def jwks_setup(mocker):
     )
 
 
+@pytest.fixture(autouse=True)
+def fresh_event_caches():
+    """Don't let cached shifter responses leak between tests"""
+    bump_event_cache_generation()
+    clear_ma_events_cache()
+    reset_state_prioritization_config()
+    zip5_centroid.cache_clear()
+    clear_attendance_cache()
+    get_global_client().circuit_breaker.reset()
+
+
 @pytest.fixture(autouse=True)
 def no_nplusone():
     """Raise an exception on any nplusone query in any test."""
@@ -256,6 +277,13 @@ def ca_zip5():
     )
 
 
+@pytest.fixture()
+def sf_zip5():
+    return USZip5.objects.create(
+        zip5="94115", state="CA", coordinates=Point(-122.4373, 37.786, srid=4326)
+    )
+
+
 @pytest.fixture()
 def ma_zip5():
     return USZip5.objects.create(
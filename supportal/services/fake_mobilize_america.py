@@ -0,0 +1,381 @@
+"""Local stand-in for the Mobilize America API
+
+Implements the endpoints MobilizeAmericaClient uses (paginated organization
+events, event details, and listing and creating event attendances) over
+synthetic events, so imports, signups and event lookups can be load tested
+offline and repeatably. Latency, server errors and bursts of 429s can be
+injected with FaultConfig.
+
+Run it with the serve_fake_mobilize_america command and point
+MOBILIZE_AMERICA_BASE_URL at it. State lives in memory and is lost on exit.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from supportal.services.mobilize_america import (
+    EVENT_TYPES,
+    PRIVATE_VISIBILITY,
+    PUBLIC_VISIBILITY,
+)
+
+_EVENTS_PATH = re.compile(r"^/v1/organizations/(?P<org>\d+)/events$")
+_EVENT_PATH = re.compile(r"^/v1/organizations/(?P<org>\d+)/events/(?P<event>\d+)$")
+_ATTENDANCES_PATH = re.compile(
+    r"^/v1/organizations/(?P<org>\d+)/events/(?P<event>\d+)/attendances$"
+)
+
+# state, timezone, and a rough center to scatter events around
+_STATES = [
+    ("IA", "America/Chicago", 41.9, -93.4),
+    ("NH", "America/New_York", 43.7, -71.6),
+    ("NV", "America/Los_Angeles", 38.5, -117.0),
+    ("SC", "America/New_York", 33.9, -80.9),
+    ("CA", "America/Los_Angeles", 36.8, -119.4),
+    ("NY", "America/New_York", 42.2, -74.9),
+    ("TX", "America/Chicago", 31.1, -97.6),
+    ("MA", "America/New_York", 42.3, -71.8),
+]
+
+
+@dataclass
+class FaultConfig:
+    # every response is delayed by latency_ms, plus up to latency_jitter_ms
+    latency_ms: float = 0
+    latency_jitter_ms: float = 0
+    # fraction of requests that fail with a 500
+    error_rate: float = 0
+    # every rate_limit_every_seconds, all requests get 429s for
+    # rate_limit_burst_seconds
+    rate_limit_every_seconds: float = 0
+    rate_limit_burst_seconds: float = 0
+
+
+def _timestamp(dt):
+    return int(dt.timestamp())
+
+
+def generate_events(count, seed=0, now=None) -> List[Dict[str, Any]]:
+    """`count` synthetic MA event payloads, the same ones for the same seed"""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    events = []
+    timeslot_id = 1
+    for event_id in range(1, count + 1):
+        state, tz, lat, lng = rng.choice(_STATES)
+        is_virtual = rng.random() < 0.1
+        timeslots = []
+        start = now + timedelta(hours=rng.randint(1, 24 * 30))
+        for _ in range(rng.randint(1, 6)):
+            timeslots.append(
+                {
+                    "id": timeslot_id,
+                    "start_date": _timestamp(start),
+                    "end_date": _timestamp(start + timedelta(hours=2)),
+                    "is_full": rng.random() < 0.05,
+                    "capacity": rng.choice([0, 10, 25, 100]),
+                }
+            )
+            timeslot_id += 1
+            start += timedelta(hours=rng.choice([3, 24, 48]))
+        event = {
+            "id": event_id,
+            "title": f"Synthetic event {event_id}",
+            "summary": "",
+            "description": "A synthetic event for load testing",
+            "event_type": rng.choice(EVENT_TYPES),
+            "visibility": (
+                PUBLIC_VISIBILITY if rng.random() < 0.9 else PRIVATE_VISIBILITY
+            ),
+            "address_visibility": PUBLIC_VISIBILITY,
+            "high_priority": rng.random() < 0.1,
+            "timezone": tz,
+            "browser_url": f"https://www.mobilize.us/fake/event/{event_id}/",
+            "tags": [
+                {"id": t, "name": f"Tag {t}"} for t in rng.sample(range(1, 20), 2)
+            ],
+            "created_date": _timestamp(now - timedelta(days=rng.randint(1, 60))),
+            "modified_date": _timestamp(
+                now - timedelta(minutes=rng.randint(1, 60 * 24))
+            ),
+            "timeslots": timeslots,
+            "location": None,
+        }
+        if not is_virtual:
+            event["location"] = {
+                "venue": f"Venue {event_id}",
+                "address_lines": [f"{rng.randint(1, 9999)} Main St", ""],
+                "locality": "Springfield",
+                "region": state,
+                "postal_code": f"{rng.randint(501, 99950):05d}",
+                "location": {
+                    "latitude": round(lat + rng.uniform(-1.5, 1.5), 4),
+                    "longitude": round(lng + rng.uniform(-1.5, 1.5), 4),
+                },
+            }
+        events.append(event)
+    return events
+
+
+class FakeMobilizeAmericaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, address, events, organization_id=1, faults=None, page_size=25, seed=0
+    ):
+        super().__init__(address, _Handler)
+        self.organization_id = organization_id
+        self.faults = faults or FaultConfig()
+        self.page_size = page_size
+        self.events = {e["id"]: e for e in events}
+        self.attendances = {}
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.request_count = 0
+        self.__rng = random.Random(seed)
+        self.__next_attendance_id = 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def serve_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def random(self):
+        with self.lock:
+            return self.__rng.random()
+
+    def create_attendances(self, event, person, timeslot_ids):
+        """Returns (status, body) for an attendance POST"""
+        timeslots = {t["id"]: t for t in event["timeslots"]}
+        now = time.time()
+        with self.lock:
+            for timeslot_id in timeslot_ids:
+                timeslot = timeslots.get(timeslot_id)
+                if timeslot is None:
+                    error = "Timeslot is not associated with event."
+                elif timeslot["end_date"] < now:
+                    error = "Cannot create an attendance for a timeslot in the past."
+                elif timeslot["is_full"]:
+                    error = "Timeslot is full."
+                else:
+                    continue
+                return HTTPStatus.BAD_REQUEST, {"error": {"timeslots": [error]}}
+
+            event_attendances = self.attendances.setdefault(event["id"], [])
+            created = []
+            for timeslot_id in timeslot_ids:
+                timeslot = timeslots[timeslot_id]
+                attendance = {
+                    "id": self.__next_attendance_id,
+                    "person": {
+                        "given_name": person.get("given_name"),
+                        "family_name": person.get("family_name"),
+                        "email_addresses": [
+                            {"primary": True, "address": person.get("email_address")}
+                        ],
+                        "postal_addresses": [
+                            {"postal_code": person.get("postal_code")}
+                        ],
+                    },
+                    "timeslot": {k: v for k, v in timeslot.items() if k != "capacity"},
+                    "event": {"id": event["id"]},
+                    "created_date": int(now),
+                    "modified_date": int(now),
+                }
+                self.__next_attendance_id += 1
+                event_attendances.append(attendance)
+                created.append(attendance)
+                taken = sum(
+                    1 for a in event_attendances if a["timeslot"]["id"] == timeslot_id
+                )
+                if timeslot["capacity"] and taken >= timeslot["capacity"]:
+                    timeslot["is_full"] = True
+                    event["modified_date"] = int(now)
+        return HTTPStatus.CREATED, {"data": created}
+
+
+def _public_event(event):
+    return {
+        **event,
+        "timeslots": [
+            {k: v for k, v in t.items() if k != "capacity"} for t in event["timeslots"]
+        ],
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeMobilizeAmericaServer
+
+    def log_message(self, format, *args):
+        logging.debug(f"Fake Mobilize America: {format % args}")
+
+    def do_GET(self):
+        self.__handle("GET")
+
+    def do_POST(self):
+        self.__handle("POST")
+
+    def __send(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def __not_found(self):
+        self.__send(HTTPStatus.NOT_FOUND, {"error": {"detail": "Not found."}})
+
+    def __inject_faults(self):
+        """Sends an injected error response, returns whether it did"""
+        faults = self.server.faults
+        delay_ms = faults.latency_ms
+        if faults.latency_jitter_ms:
+            delay_ms += self.server.random() * faults.latency_jitter_ms
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        every = faults.rate_limit_every_seconds
+        if every:
+            elapsed = time.monotonic() - self.server.started_at
+            if elapsed % every < faults.rate_limit_burst_seconds:
+                self.__send(
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                    {"error": {"detail": "Request was throttled."}},
+                    headers={"Retry-After": str(int(every))},
+                )
+                return True
+        if faults.error_rate and self.server.random() < faults.error_rate:
+            self.__send(
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                {"error": {"detail": "Internal server error."}},
+            )
+            return True
+        return False
+
+    def __page(self, items, query):
+        page = int(query.get("page", 1))
+        per_page = int(query.get("per_page", self.server.page_size))
+        start = (page - 1) * per_page
+        next_url = None
+        if start + per_page < len(items):
+            next_query = urlencode({**query, "page": page + 1})
+            path = urlsplit(self.path).path
+            next_url = f"http://{self.headers['Host']}{path}?{next_query}"
+        return {
+            "count": len(items),
+            "next": next_url,
+            "previous": None,
+            "data": items[start : start + per_page],
+        }
+
+    def __read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return None
+
+    def __handle(self, method):
+        # Read the body even if we don't get to use it, so it isn't mistaken
+        # for the next request on the connection
+        self.__body = self.__read_json() if method == "POST" else None
+        with self.server.lock:
+            self.server.request_count += 1
+        if not self.headers.get("Authorization"):
+            self.__send(
+                HTTPStatus.UNAUTHORIZED,
+                {"error": {"detail": "Authentication credentials were not provided."}},
+            )
+            return
+        if self.__inject_faults():
+            return
+
+        parts = urlsplit(self.path)
+        query = dict(parse_qsl(parts.query))
+        for pattern, handler in [
+            (_EVENTS_PATH, self.__events),
+            (_EVENT_PATH, self.__event),
+            (_ATTENDANCES_PATH, self.__attendances),
+        ]:
+            match = pattern.match(parts.path)
+            if match:
+                if int(match.group("org")) != self.server.organization_id:
+                    self.__not_found()
+                    return
+                handler(method, match, query)
+                return
+        self.__not_found()
+
+    def __events(self, method, match, query):
+        if method != "GET":
+            self.__send(HTTPStatus.METHOD_NOT_ALLOWED, {"error": {}})
+            return
+        visibility = query.get("visibility", PUBLIC_VISIBILITY)
+        updated_since = int(query.get("updated_since", 0))
+        with self.server.lock:
+            events = [
+                _public_event(e)
+                for e in self.server.events.values()
+                if e["visibility"] == visibility and e["modified_date"] >= updated_since
+            ]
+        self.__send(HTTPStatus.OK, self.__page(events, query))
+
+    def __event(self, method, match, query):
+        event = self.server.events.get(int(match.group("event")))
+        if method != "GET" or event is None:
+            self.__not_found()
+            return
+        with self.server.lock:
+            self.__send(HTTPStatus.OK, {"data": _public_event(event)})
+
+    def __attendances(self, method, match, query):
+        event = self.server.events.get(int(match.group("event")))
+        if event is None:
+            self.__not_found()
+            return
+        if method == "GET":
+            with self.server.lock:
+                attendances = list(self.server.attendances.get(event["id"], []))
+            self.__send(HTTPStatus.OK, self.__page(attendances, query))
+            return
+
+        body = self.__body
+        if not body or not body.get("person") or not body.get("timeslots"):
+            self.__send(
+                HTTPStatus.BAD_REQUEST, {"error": {"detail": "Invalid request."}}
+            )
+            return
+        person = body["person"]
+        if not re.match(r"^\d{5}$", str(person.get("postal_code", ""))):
+            self.__send(
+                HTTPStatus.BAD_REQUEST,
+                {
+                    "error": {
+                        "person": {
+                            "postal_code": ["Please enter a valid 5-digit US zipcode."]
+                        }
+                    }
+                },
+            )
+            return
+        timeslot_ids = [t.get("timeslot_id") for t in body["timeslots"]]
+        status, response = self.server.create_attendances(event, person, timeslot_ids)
+        self.__send(status, response)
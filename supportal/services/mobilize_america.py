@@ -1,17 +1,28 @@
+import hashlib
 import json
 import logging
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from copy import deepcopy
 from dataclasses import asdict, dataclass
 from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from requests import Session
 from requests.adapters import HTTPAdapter
 from requests.auth import AuthBase
-from requests.exceptions import ConnectionError
+from requests.exceptions import ConnectionError, RequestException, Timeout
 
 from urllib3 import Retry
 
+from supportal.coalescing import fetch_coalesced
+
 # from ew_common.telemetry import telemetry  # isort:skip
 
 PUBLIC_VISIBILITY = "PUBLIC"
@@ -45,6 +56,16 @@ EVENT_TYPES = [
     "OTHER",
 ]
 
+ATTENDANCE_CACHE_GENERATION_KEY = "ma_attendance_cache_generation"
+ATTENDANCE_CACHE_KEY_PREFIX = "ma_attendances"
+CIRCUIT_BREAKER_NAME = "mobilize_america"
+CIRCUIT_OPEN_DETAIL = "Mobilize America is unavailable, try again later."
+SINGLE_FLIGHT_KEY_PREFIX = "ma_single_flight"
+# How long a GET waits for another instance making the same call before making
+# it itself
+SINGLE_FLIGHT_WAIT_SECONDS = 5
+SINGLE_FLIGHT_POLL_SECONDS = 0.05
+
 __CLIENT = None
 
 
@@ -58,11 +79,44 @@ def get_global_client():
         args = [org_id, vis, url, key]
         if not all(args):
             raise ImproperlyConfigured("Missing required Mobilize America settings")
-        __CLIENT = MobilizeAmericaClient(*args)
+        __CLIENT = MobilizeAmericaClient(
+            *args,
+            timeout_seconds=settings.MOBILIZE_AMERICA_TIMEOUT_SECONDS,
+            circuit_breaker=CircuitBreaker(
+                CIRCUIT_BREAKER_NAME,
+                failure_threshold=settings.MOBILIZE_AMERICA_CIRCUIT_BREAKER_FAILURES,
+                reset_timeout=settings.MOBILIZE_AMERICA_CIRCUIT_BREAKER_RESET_SECONDS,
+            ),
+        )
 
     return __CLIENT
 
 
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def _email_digest(email):
+    # Keeps email addresses out of cache key names
+    return hashlib.sha1(normalize_email(email).encode("utf-8")).hexdigest()
+
+
+def _attendance_email(attendance):
+    email_addresses = attendance.get("person", {}).get("email_addresses", [])
+    if len(email_addresses) < 1:
+        return None
+    return normalize_email(email_addresses[0].get("address", None)) or None
+
+
+def _new_attendance_cache_generation():
+    return int(time.time() * 1000)
+
+
+def clear_attendance_cache():
+    """Forget every cached event attendance"""
+    cache.set(ATTENDANCE_CACHE_GENERATION_KEY, _new_attendance_cache_generation(), None)
+
+
 class MobilizeAmericaAPIException(Exception):
     def __init__(self, response, status_code):
         errors = response.get("error", {})
@@ -73,6 +127,67 @@ class MobilizeAmericaAPIException(Exception):
         super().__init__(response, status_code)
 
 
+class CircuitBreaker:
+    """Stops calling a failing service for a while, shared between processes
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    refuses calls for `reset_timeout` seconds. It then half-opens and lets one
+    call at a time through: a success closes it again, a failure reopens it.
+    State lives in the cache, so every instance backs off together.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.__failures_key = f"circuit_breaker:{name}:failures"
+        self.__opened_at_key = f"circuit_breaker:{name}:opened_at"
+        self.__probe_key = f"circuit_breaker:{name}:probe"
+
+    def is_open(self):
+        """Whether calls are being refused, not counting half-open probes"""
+        opened_at = cache.get(self.__opened_at_key)
+        return opened_at is not None and time.time() - opened_at < self.reset_timeout
+
+    def allow_request(self):
+        opened_at = cache.get(self.__opened_at_key)
+        if opened_at is None:
+            return True
+        if time.time() - opened_at < self.reset_timeout:
+            return False
+        return cache.add(self.__probe_key, True, self.reset_timeout)
+
+    def record_success(self):
+        cache.delete_many([self.__failures_key, self.__opened_at_key, self.__probe_key])
+
+    def record_failure(self):
+        cache.add(self.__failures_key, 0, None)
+        try:
+            failures = cache.incr(self.__failures_key) or 0
+        except ValueError:
+            # reset by a success in the meantime
+            failures = 1
+        was_open = cache.get(self.__opened_at_key) is not None
+        if was_open or failures >= self.failure_threshold:
+            if not was_open:
+                logging.warning(
+                    f"Opening the {self.name} circuit breaker after {failures} failures"
+                )
+            cache.set(self.__opened_at_key, time.time(), None)
+            cache.delete(self.__probe_key)
+
+    def reset(self):
+        self.record_success()
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
 class MobilizeAmericaAPIAuth(AuthBase):
     """https://github.com/mobilizeamerica/api#authentication"""
 
@@ -103,6 +218,60 @@ class Referrer:
     url: Optional[str] = None
 
 
+def _attendance_cache_key(organization_id, event_id, suffix):
+    generation = cache.get_or_set(
+        ATTENDANCE_CACHE_GENERATION_KEY, _new_attendance_cache_generation, None
+    )
+    return (
+        f"{ATTENDANCE_CACHE_KEY_PREFIX}:{generation}:"
+        f"{organization_id}:{event_id}:{suffix}"
+    )
+
+
+def get_cached_attendances(organization_id, event_id, email):
+    """The person's cached {timeslot_id: attendance} for the event
+
+    Returns None if the event's attendances aren't cached.
+    """
+    loaded_key = _attendance_cache_key(organization_id, event_id, "loaded")
+    person_key = _attendance_cache_key(organization_id, event_id, _email_digest(email))
+    cached = cache.get_many([loaded_key, person_key])
+    if loaded_key not in cached:
+        return None
+    return cached.get(person_key, {})
+
+
+def cache_event_attendances(organization_id, event_id, attendances):
+    """Cache all of an event's attendances, returns them by email and timeslot"""
+    attendances_by_email = defaultdict(dict)
+    for attendance in attendances:
+        email = _attendance_email(attendance)
+        timeslot = attendance.get("timeslot", {}).get("id", None)
+        if email and timeslot:
+            attendances_by_email[email][timeslot] = attendance
+
+    # The loaded marker goes in the same write as the attendances, so they
+    # expire together and nobody sees the marker without them
+    entries = {
+        _attendance_cache_key(organization_id, event_id, _email_digest(email)): value
+        for email, value in attendances_by_email.items()
+    }
+    entries[_attendance_cache_key(organization_id, event_id, "loaded")] = True
+    cache.set_many(entries, settings.MOBILIZE_AMERICA_ATTENDANCE_CACHE_TIMEOUT)
+    return attendances_by_email
+
+
+def cache_new_attendances(organization_id, event_id, email, new_attendances):
+    """Add attendances we just created to the person's cached attendances"""
+    key = _attendance_cache_key(organization_id, event_id, _email_digest(email))
+    attendances = cache.get(key) or {}
+    for attendance in new_attendances:
+        timeslot = attendance.get("timeslot", {}).get("id", None)
+        if timeslot:
+            attendances[timeslot] = attendance
+    cache.set(key, attendances, settings.MOBILIZE_AMERICA_ATTENDANCE_CACHE_TIMEOUT)
+
+
 class MobilizeAmericaClient:
     def __init__(
         self,
@@ -113,12 +282,16 @@ class MobilizeAmericaClient:
         retries=3,
         backoff_factor=1,
         retry_statuses=(429,),
+        timeout_seconds=None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ):
         self.organization_id = organization_id
         self.default_visibility = default_visibility
         self.__retries = retries
         self.__backoff_factor = backoff_factor
         self.__retry_statuses = retry_statuses
+        self.__timeout_seconds = timeout_seconds
+        self.__circuit_breaker = circuit_breaker
 
         self.__session_auth = None
         if api_key is None:
@@ -127,7 +300,12 @@ class MobilizeAmericaClient:
             self.__session_auth = MobilizeAmericaAPIAuth(api_key)
         self.__session = self.__new_session()
         self.__base_url = base_url.strip("/")
-        self.__cached_attendances = {}
+        self.__in_flight = {}
+        self.__in_flight_lock = threading.Lock()
+
+    @property
+    def circuit_breaker(self) -> Optional[CircuitBreaker]:
+        return self.__circuit_breaker
 
     def __new_session(self):
         s = Session()
@@ -144,17 +322,70 @@ class MobilizeAmericaClient:
         s.mount("https://", adapter)
         return s
 
-    def __make_request(self, method, url, **kwargs):
-        logging.debug(f"Making MA API call {method} {url} w/ args {kwargs}")
+    def __endpoint(self, url):
+        """The API path of a url with ids stripped out, to group calls by"""
+        path = urlsplit(url).path
+        base_path = urlsplit(self.__base_url).path
+        if path.startswith(base_path):
+            path = path[len(base_path) :]
+        return re.sub(r"/\d+", "/{id}", path)
+
+    def __record_call(self, method, url, started_at, outcome, failed):
+        elapsed_ms = int((time.monotonic() - started_at) * 1000)
+        # telemetry.event(
+        #     "Mobilize America API Call",
+        #     method=method,
+        #     endpoint=self.__endpoint(url),
+        #     outcome=outcome,
+        #     elapsed_ms=elapsed_ms,
+        # )
+        logging.info(
+            f"MA API call {method} {self.__endpoint(url)}: {outcome} in {elapsed_ms}ms"
+        )
+        if self.__circuit_breaker:
+            if failed:
+                self.__circuit_breaker.record_failure()
+            else:
+                self.__circuit_breaker.record_success()
+
+    def __send(self, method, url, **kwargs):
         try:
-            res = self.__session.request(method=method, url=url, **kwargs)
+            return self.__session.request(method=method, url=url, **kwargs)
         # retry connection errors once
         except ConnectionError as e:
             logging.warning(
                 f"Refreshing session. Error connecting to Mobilize America: {e}"
             )
             self.__session = self.__new_session()
-            res = self.__session.request(method=method, url=url, **kwargs)
+            return self.__session.request(method=method, url=url, **kwargs)
+
+    def __make_request(self, method, url, **kwargs):
+        logging.debug(f"Making MA API call {method} {url} w/ args {kwargs}")
+        if self.__circuit_breaker and not self.__circuit_breaker.allow_request():
+            logging.info(f"MA API call {method} {self.__endpoint(url)}: circuit open")
+            raise MobilizeAmericaAPIException(
+                {"error": {"detail": CIRCUIT_OPEN_DETAIL}}, status_code=503
+            )
+        if self.__timeout_seconds:
+            kwargs.setdefault("timeout", self.__timeout_seconds)
+
+        started_at = time.monotonic()
+        try:
+            res = self.__send(method, url, **kwargs)
+        except RequestException as e:
+            status_code = 504 if isinstance(e, Timeout) else 503
+            self.__record_call(method, url, started_at, type(e).__name__, failed=True)
+            raise MobilizeAmericaAPIException(
+                {"error": {"detail": f"Error calling Mobilize America: {e}"}},
+                status_code=status_code,
+            )
+        self.__record_call(
+            method,
+            url,
+            started_at,
+            res.status_code,
+            failed=res.status_code > 499 or res.status_code in self.__retry_statuses,
+        )
 
         try:
             payload = json.loads(res.text)
@@ -171,8 +402,58 @@ class MobilizeAmericaClient:
             raise MobilizeAmericaAPIException(payload, status_code=res.status_code)
         return payload
 
+    def __single_flight_get(self, url, params=None):
+        """GET url, sharing the response with identical concurrent GETs
+
+        Within a process, callers wait for the GET already in flight. Across
+        instances, a short lock in the cache lets one caller make the call
+        while the others wait for its response there.
+        """
+        key = hashlib.sha1(
+            json.dumps([url, params], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        with self.__in_flight_lock:
+            call = self.__in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self.__in_flight[key] = call
+            else:
+                call.waiters += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # callers are free to modify what they get back
+            return deepcopy(call.result)
+
+        try:
+            # Only responses fetched after we started waiting count, so we
+            # never get one older than a call of our own would have been
+            call.result = fetch_coalesced(
+                f"{SINGLE_FLIGHT_KEY_PREFIX}:{key}",
+                lambda: self.__make_request("GET", url, params=params),
+                SINGLE_FLIGHT_WAIT_SECONDS,
+                wait_seconds=SINGLE_FLIGHT_WAIT_SECONDS,
+                poll_seconds=SINGLE_FLIGHT_POLL_SECONDS,
+                newer_only=True,
+            )
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.__in_flight_lock:
+                del self.__in_flight[key]
+            call.done.set()
+        # Nobody can start waiting once the call is out of __in_flight. If
+        # nobody did, the response is ours alone and doesn't need copying.
+        if call.waiters:
+            return deepcopy(call.result)
+        return call.result
+
     def __paginate(
-        self, first_page_response: Dict[str, Any]
+        self, first_page_response: Dict[str, Any], get=None
     ) -> Iterator[Dict[str, Any]]:
         """Generic method to paginate through Mobilize America GET results"""
         page = first_page_response
@@ -181,62 +462,101 @@ class MobilizeAmericaClient:
             next_page = page.get("next")
             if not next_page:
                 break
-            page = self.__make_request("GET", next_page)
+            if get:
+                page = get(next_page)
+            else:
+                page = self.__make_request("GET", next_page)
 
     def list_organization_events(self, params=None) -> Iterator[Dict[str, Any]]:
         """List organization events, returns a generator for paging
 
+        Identical concurrent calls share their pages, see __single_flight_get.
+
         See: https://github.com/mobilizeamerica/api#list-organization-events
         """
         params = {"visibility": self.default_visibility, **(params or {})}
         url = f"{self.__base_url}/organizations/{self.organization_id}/events"
-        return self.__paginate(self.__make_request("GET", url, params=params))
-
-    def get_organization_event(self, event_id):
-        url = (
-            f"{self.__base_url}/organizations/{self.organization_id}/events/{event_id}"
+        return self.__paginate(
+            self.__single_flight_get(url, params=params), get=self.__single_flight_get
         )
+
+    def get_organization_events_page(self, params=None) -> Dict[str, Any]:
+        """Fetch the first page of list_organization_events"""
+        params = {"visibility": self.default_visibility, **(params or {})}
+        url = f"{self.__base_url}/organizations/{self.organization_id}/events"
+        return self.__make_request("GET", url, params=params)
+
+    def get_page(self, url) -> Dict[str, Any]:
+        """Fetch a page of results by URL, e.g. from another page's next link"""
         return self.__make_request("GET", url)
 
-    def __is_email_in_attendance(self, email, attendance):
-        email_addresses = attendance.get("person", {}).get("email_addresses", [])
-        if len(email_addresses) < 1:
+    @staticmethod
+    def remaining_page_urls(first_page: Dict[str, Any]) -> Optional[List[str]]:
+        """URLs of every page after first_page, so they can be fetched at once
+
+        Worked out from the first page's `count` and `next` link. Returns None
+        if that isn't possible, in which case callers have to follow the `next`
+        links one at a time.
+        """
+        next_page = first_page.get("next")
+        if not next_page:
+            return []
+        count = first_page.get("count")
+        page_size = len(first_page.get("data", []))
+        parts = urlsplit(next_page)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        if not count or not page_size or dict(query).get("page") != "2":
             return None
-        if email_addresses[0].get("address", None) == email:
-            return attendance
-        return None
+        return [
+            urlunsplit(
+                parts._replace(
+                    query=urlencode(
+                        [(k, str(page) if k == "page" else v) for k, v in query]
+                    )
+                )
+            )
+            for page in range(2, math.ceil(count / page_size) + 1)
+        ]
 
-    def __check_cache_for_attendance(self, event_id, timeslot_ids, email):
-        event_attendances_in_cache = self.__cached_attendances.get(event_id, {})
-        attendances, remaining_timeslots = [], timeslot_ids
+    def get_organization_event(self, event_id):
+        url = (
+            f"{self.__base_url}/organizations/{self.organization_id}/events/{event_id}"
+        )
+        return self.__single_flight_get(url)
 
-        for attendance in event_attendances_in_cache:
-            timeslot = attendance.get("timeslot", {}).get("id", None)
-            if (
-                timeslot
-                and (timeslot in timeslot_ids)
-                and self.__is_email_in_attendance(email, attendance)
-            ):
-                attendances.append(attendance)
-                remaining_timeslots.remove(timeslot)
+    def __load_event_attendances(self, event_id):
+        """Page through every attendance for the event and cache them by email"""
+        url = f"{self.__base_url}/organizations/{self.organization_id}/events/{event_id}/attendances"
+        attendances = []
+        for page in self.__paginate(self.__make_request("GET", url)):
+            attendances.extend(page.get("data", []))
+        return cache_event_attendances(self.organization_id, event_id, attendances)
 
-        return attendances, remaining_timeslots
+    def prefetch_event_attendances(self, event_id):
+        """Cache the event's attendances, if they aren't already
 
-    def __update_cache_attendances(self, event_id):
-        url = f"{self.__base_url}/organizations/{self.organization_id}/events/{event_id}/attendances"
-        all_attendances_for_all_timeslots = self.__make_request("GET", url)["data"]
-        self.__cached_attendances[event_id] = all_attendances_for_all_timeslots
+        Useful before making many signups for the same event at once, which
+        would otherwise all fetch them.
+        """
+        if get_cached_attendances(self.organization_id, event_id, "") is None:
+            self.__load_event_attendances(event_id)
 
     def check_for_event_attendance(self, event_id, timeslot_ids, email):
-        attedances, remaining_timeslots = self.__check_cache_for_attendance(
-            event_id, timeslot_ids, email
-        )
-        if not attedances:
-            self.__update_cache_attendances(event_id)
-            attedances, remaining_timeslots = self.__check_cache_for_attendance(
-                event_id, timeslot_ids, email
+        """Find the person's existing attendances for any of timeslot_ids
+
+        Attendances are cached in Redis per event and email, so an event's
+        attendance list is only fetched from Mobilize America once per
+        MOBILIZE_AMERICA_ATTENDANCE_CACHE_TIMEOUT across all instances.
+        Returns (existing attendances, timeslot ids without one).
+        """
+        existing = get_cached_attendances(self.organization_id, event_id, email)
+        if existing is None:
+            existing = self.__load_event_attendances(event_id).get(
+                normalize_email(email), {}
             )
-        return attedances, remaining_timeslots
+        attendances = [existing[t] for t in timeslot_ids if t in existing]
+        remaining_timeslots = [t for t in timeslot_ids if t not in existing]
+        return attendances, remaining_timeslots
 
     def __post_event_attendance(
         self,
@@ -286,6 +606,12 @@ class MobilizeAmericaClient:
             event_id, remaining_timeslots, person, referrer
         )
         if new_attendances_response and len(new_attendances_response["data"]) > 0:
+            cache_new_attendances(
+                self.organization_id,
+                event_id,
+                person.email_address,
+                new_attendances_response["data"],
+            )
             new_attendances_response["data"].extend(existing_attendances)
             return new_attendances_response, remaining_timeslots
         return {"data": existing_attendances}, []
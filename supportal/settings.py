@@ -156,6 +156,67 @@ REST_FRAMEWORK = {
 # Shifter uses separate IP based rate limiting:
 SHIFTER_IP_RATE_LIMIT = "20/min"
 
+# How long (in seconds) prepared recommended_events responses are cached for.
+# Event imports and prioritization updates invalidate the cache regardless.
+SHIFTER_RECOMMENDATION_CACHE_TIMEOUT = 60
+
+# Live Mobilize America event searches are served from the cache for this many
+# seconds, after which they're refreshed in the background. Stale results are
+# served until they're evicted.
+SHIFTER_MA_EVENTS_CACHE_FRESH_SECONDS = 60
+SHIFTER_MA_EVENTS_CACHE_STALE_SECONDS = 15 * 60
+
+# Sanitized event detail payloads are cached for this many seconds, and
+# browsers/CDNs are allowed to cache them for as long. Events Mobilize America
+# says don't exist are cached for a shorter time.
+SHIFTER_EVENT_DETAIL_CACHE_TIMEOUT = 60
+SHIFTER_EVENT_DETAIL_NOT_FOUND_CACHE_TIMEOUT = 10
+
+# Limits for the batch event lookup endpoint: how many ids a request can ask
+# for, and how many of them are fetched from Mobilize America at once.
+SHIFTER_EVENT_BATCH_MAX_IDS = 25
+SHIFTER_EVENT_BATCH_MA_CONCURRENCY = 5
+
+# The default (hybrid) recommendation strategy stops trusting our event tables
+# and goes to Mobilize America if the last event import is older than this.
+SHIFTER_HYBRID_MAX_IMPORT_AGE_SECONDS = 30 * 60
+
+# import_mobilize_america_events only fetches events updated since its last
+# successful run, with a full import (which also deactivates deleted and past
+# events) at least this often.
+SHIFTER_EVENT_IMPORT_FULL_SWEEP_SECONDS = 60 * 60
+SHIFTER_EVENT_IMPORT_WATERMARK_OVERLAP_SECONDS = 5 * 60
+# How many pages of events the import fetches from Mobilize America at once
+SHIFTER_EVENT_IMPORT_MA_CONCURRENCY = 4
+
+# When enabled, RecommendedEventRequestLogs are pushed onto a Redis list and
+# written in batches by the flush_recommendation_logs command instead of being
+# inserted during the request.
+SHIFTER_BUFFER_REQUEST_LOGS = bool(
+    int(os.environ.get("SHIFTER_BUFFER_REQUEST_LOGS", 0))
+)
+SHIFTER_REQUEST_LOG_BUFFER_MAX_LENGTH = 100000
+
+# When enabled, EventSignups are saved without calling Mobilize America and are
+# sent in the background by the drain_signup_outbox command. It (and
+# retry_ma_events) send SHIFTER_SIGNUP_OUTBOX_CONCURRENCY signups at once, starting
+# at most SHIFTER_SIGNUP_OUTBOX_SENDS_PER_SECOND signups or attendance prefetches
+# a second. Each of those usually makes one call to Mobilize America, but can
+# make more (paginated attendances, retries).
+SHIFTER_SIGNUP_OUTBOX = bool(int(os.environ.get("SHIFTER_SIGNUP_OUTBOX", 0)))
+SHIFTER_SIGNUP_OUTBOX_CONCURRENCY = 4
+SHIFTER_SIGNUP_OUTBOX_SENDS_PER_SECOND = 10
+# drain_signup_outbox stops starting new batches after this long, which leaves
+# time for the last one to finish within the function's 300s timeout
+SHIFTER_SIGNUP_OUTBOX_DRAIN_SECONDS = 4 * 60
+
+# Binary zip5 lookup table built by the build_zip5_table command (make
+# zip5-table, which make deploy runs), relative to BASE_DIR. Zip lookups fall
+# back to the database when this is unset or the file can't be loaded.
+SHIFTER_ZIP5_TABLE_PATH = os.environ.get("SHIFTER_ZIP5_TABLE_PATH")
+if SHIFTER_ZIP5_TABLE_PATH:
+    SHIFTER_ZIP5_TABLE_PATH = os.path.join(BASE_DIR, SHIFTER_ZIP5_TABLE_PATH)
+
 # This is required for geodjango when running in AWS Lambda or if GDAL is
 # installed in a non-standard location.
 if "GDAL_LIBRARY_PATH" in os.environ:
@@ -246,6 +307,18 @@ MOBILIZE_AMERICA_ORG_ID = get_env_var("MOBILIZE_AMERICA_ORG_ID", optional=True)
 MOBILIZE_AMERICA_ORG_ID = MOBILIZE_AMERICA_ORG_ID and int(MOBILIZE_AMERICA_ORG_ID)
 MOBILIZE_AMERICA_API_KEY = get_env_var("MOBILIZE_AMERICA_API_KEY", optional=True)
 
+# How long a Mobilize America event's attendances are cached for when checking
+# whether someone is already signed up for a shift
+MOBILIZE_AMERICA_ATTENDANCE_CACHE_TIMEOUT = 10 * 60
+
+# Calls to Mobilize America time out after this many seconds. After
+# MOBILIZE_AMERICA_CIRCUIT_BREAKER_FAILURES consecutive errors or timeouts we
+# stop calling Mobilize America for MOBILIZE_AMERICA_CIRCUIT_BREAKER_RESET_SECONDS
+# and fail fast instead; signups made in the meantime are left for retry_ma_events.
+MOBILIZE_AMERICA_TIMEOUT_SECONDS = 10
+MOBILIZE_AMERICA_CIRCUIT_BREAKER_FAILURES = 5
+MOBILIZE_AMERICA_CIRCUIT_BREAKER_RESET_SECONDS = 30
+
 # Useful for testing against staging but should never be turned on in production
 MOBILIZE_AMERICA_DEFAULT_VISIBILITY = get_env_var(
     "MOBILIZE_AMERICA_DEFAULT_VISIBILITY", optional=True, default="PUBLIC"
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import FrozenSet
+
+from django.core.cache import cache
+
+from supportal.coalescing import fetch_coalesced, store
+
+EVENT_CACHE_GENERATION_KEY = "shifter_event_cache_generation"
+LAST_EVENT_IMPORT_KEY = "shifter_last_event_import_at"
+STATE_PRIORITIZATION_VERSION_KEY = "shifter_state_prioritization_version"
+# How often a process checks whether its state prioritization snapshot is stale
+STATE_PRIORITIZATION_CHECK_INTERVAL_SECONDS = 10
+RECOMMENDATION_CACHE_KEY_PREFIX = "shifter_recommendations"
+EVENT_DETAIL_CACHE_KEY_PREFIX = "shifter_event_detail"
+MA_EVENTS_CACHE_KEY_PREFIX = "shifter_ma_events"
+MA_EVENTS_CACHE_GENERATION_KEY = "shifter_ma_events_cache_generation"
+
+# How long a process waits for another one to fill a cache entry before it
+# gives up and fetches the value itself
+COALESCE_WAIT_SECONDS = 5
+COALESCE_POLL_SECONDS = 0.05
+
+# Striped rather than per-key so the number of locks stays bounded
+_local_fetch_locks = [threading.Lock() for _ in range(32)]
+
+
+def _new_generation():
+    # Millisecond timestamps rather than a counter: if the generation key is
+    # ever evicted we can't accidentally go back to a generation that still
+    # has entries in the cache.
+    return int(time.time() * 1000)
+
+
+def get_event_cache_generation():
+    """The current generation of all cached event data
+
+    Every cache key that depends on the contents of the event tables should
+    include this value so that it can be invalidated in one go.
+    """
+    return cache.get_or_set(EVENT_CACHE_GENERATION_KEY, _new_generation, None)
+
+
+def bump_event_cache_generation():
+    """Invalidate all cached event data, call after changing the event tables"""
+    cache.set(EVENT_CACHE_GENERATION_KEY, _new_generation(), None)
+
+
+@dataclass(frozen=True)
+class StatePrioritizationConfig:
+    """Snapshot of the State prioritization settings used for recommendations"""
+
+    # states that order their events by the prioritization doc
+    doc_prio_states: FrozenSet[str]
+
+
+_state_prioritization = {"config": None, "version": None, "checked_at": 0}
+
+
+def _load_state_prioritization_config():
+    # imported here to keep this module free of model imports at load time
+    from supportal.shifter.models import State
+
+    doc_prio_states = (
+        State.objects.filter(use_prioritization_doc=True)
+        .exclude(prioritization_doc="")
+        .values_list("state_code", flat=True)
+    )
+    return StatePrioritizationConfig(doc_prio_states=frozenset(doc_prio_states))
+
+
+def get_state_prioritization_config():
+    """In-process snapshot of the state prioritization config
+
+    The snapshot is reloaded from the database when the version in the shared
+    cache changes, which update_prioritization_meta does after every run.
+    """
+    snapshot = _state_prioritization
+    now = time.time()
+    if (
+        snapshot["config"] is not None
+        and now - snapshot["checked_at"] < STATE_PRIORITIZATION_CHECK_INTERVAL_SECONDS
+    ):
+        return snapshot["config"]
+
+    version = cache.get_or_set(STATE_PRIORITIZATION_VERSION_KEY, _new_generation, None)
+    # If the cache is unavailable we can't tell whether we're up to date
+    if snapshot["config"] is None or version is None or version != snapshot["version"]:
+        snapshot["config"] = _load_state_prioritization_config()
+        snapshot["version"] = version
+    snapshot["checked_at"] = now
+    return snapshot["config"]
+
+
+def bump_state_prioritization_version():
+    """Invalidate every process's state prioritization snapshot"""
+    cache.set(STATE_PRIORITIZATION_VERSION_KEY, _new_generation(), None)
+    reset_state_prioritization_config()
+
+
+def reset_state_prioritization_config():
+    """Drop this process's snapshot, e.g. after changing States directly"""
+    _state_prioritization["config"] = None
+
+
+def record_event_import():
+    """Note that the event tables were just refreshed from Mobilize America"""
+    cache.set(LAST_EVENT_IMPORT_KEY, time.time(), None)
+
+
+def last_event_import_at():
+    """Unix timestamp of the last completed event import, if we know of one"""
+    return cache.get(LAST_EVENT_IMPORT_KEY)
+
+
+def recommendation_cache_key(params):
+    """Cache key for a set of canonicalized recommendation parameters
+
+    Callers are responsible for normalizing params (sorting lists, rounding
+    times) so that equivalent requests map to the same key.
+    """
+    return params_cache_key(RECOMMENDATION_CACHE_KEY_PREFIX, params)
+
+
+def event_detail_cache_key(event_id):
+    """Cache key for the sanitized payload of a single event"""
+    return f"{EVENT_DETAIL_CACHE_KEY_PREFIX}:{get_event_cache_generation()}:{event_id}"
+
+
+def params_cache_key(prefix, params):
+    """Cache key for a dict of query params, scoped to the event cache generation"""
+    return f"{prefix}:{get_event_cache_generation()}:{_params_digest(params)}"
+
+
+def ma_events_cache_key(params):
+    """Cache key for a Mobilize America event search
+
+    Mobilize America's results don't depend on our event tables, so unlike
+    params_cache_key these keys aren't scoped to the event cache generation and
+    survive imports.
+    """
+    generation = cache.get_or_set(MA_EVENTS_CACHE_GENERATION_KEY, _new_generation, None)
+    return f"{MA_EVENTS_CACHE_KEY_PREFIX}:{generation}:{_params_digest(params)}"
+
+
+def clear_ma_events_cache():
+    """Invalidate all cached Mobilize America event searches"""
+    cache.set(MA_EVENTS_CACHE_GENERATION_KEY, _new_generation(), None)
+
+
+def _params_digest(params):
+    canonical = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def get_stale_while_revalidate(key, fetch, fresh_for, stale_for):
+    """Get a value from the cache, serving stale values while they are refreshed
+
+    Values younger than `fresh_for` seconds are returned as-is. The first
+    request to see an older value refreshes it before responding, and requests
+    that arrive during the refresh get the stale value. Refreshes happen inline
+    rather than in the background because Lambda freezes the process once the
+    response is sent. Values are evicted after `stale_for` seconds, after which
+    callers have to wait for `fetch`. Concurrent misses for the same key, in
+    this process or others, share one call to `fetch`. Exceptions raised by
+    `fetch` are not cached.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() - entry["fetched_at"] > fresh_for:
+            return _refresh_or_serve_stale(key, fetch, stale_for, entry["value"])
+        return entry["value"]
+    with _local_fetch_locks[hash(key) % len(_local_fetch_locks)]:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["value"]
+        return fetch_coalesced(
+            key,
+            fetch,
+            stale_for,
+            wait_seconds=COALESCE_WAIT_SECONDS,
+            poll_seconds=COALESCE_POLL_SECONDS,
+        )
+
+
+def _refresh_or_serve_stale(key, fetch, stale_for, stale_value):
+    lock_key = f"{key}:refresh_lock"
+    if not cache.add(lock_key, True, COALESCE_WAIT_SECONDS * 2):
+        # someone else is refreshing it
+        return stale_value
+    try:
+        return store(key, fetch(), stale_for)
+    except Exception:
+        logging.exception(f"Failed to refresh {key}, serving stale value")
+        return stale_value
+    finally:
+        cache.delete(lock_key)
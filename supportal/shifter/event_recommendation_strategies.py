@@ -1,4 +1,5 @@
 import logging
+import time
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
@@ -14,7 +15,14 @@ from supportal.services.mobilize_america import (
     MobilizeAmericaAPIException,
     get_global_client,
 )
-from supportal.shifter.models import MobilizeAmericaEvent, State, USZip5
+from supportal.shifter.caching import (
+    get_stale_while_revalidate,
+    get_state_prioritization_config,
+    last_event_import_at,
+    ma_events_cache_key,
+)
+from supportal.shifter.models import MobilizeAmericaEvent, USZip5
+from supportal.shifter.zip5_table import lookup_zip5
 
 
 class BaseRecommendationStrategy(ABC):
@@ -84,8 +92,18 @@ class MobilizeAmericaAPIRecommendationStrategy(BaseRecommendationStrategy):
             params["zipcode"] = zip5
             params["max_dist"] = max_dist
 
+        events = get_stale_while_revalidate(
+            ma_events_cache_key(params),
+            lambda: cls._fetch_first_page(params),
+            fresh_for=settings.SHIFTER_MA_EVENTS_CACHE_FRESH_SECONDS,
+            stale_for=settings.SHIFTER_MA_EVENTS_CACHE_STALE_SECONDS,
+        )
+        return events[0:limit]
+
+    @staticmethod
+    def _fetch_first_page(params):
         res = get_global_client().list_organization_events(params)
-        return next(res)["data"][0:limit]
+        return next(res)["data"]
 
 
 class DBRecommendationStrategy(BaseRecommendationStrategy):
@@ -98,12 +116,8 @@ class DBRecommendationStrategy(BaseRecommendationStrategy):
 
     @classmethod
     def _filter_to_states_with_prio(cls, state_codes):
-        return (
-            State.objects.filter(state_code__in=state_codes)
-            .filter(use_prioritization_doc=True)
-            .exclude(prioritization_doc="")
-            .values("state_code")
-        )
+        doc_prio_states = get_state_prioritization_config().doc_prio_states
+        return [code for code in state_codes if code in doc_prio_states]
 
     @classmethod
     def find_events(
@@ -139,10 +153,11 @@ class DBRecommendationStrategy(BaseRecommendationStrategy):
                 MobilizeAmericaEvent.objects.filter(**filter_args)
                 .annotate(earliest_timeslot=Min("timeslots__start_date"))
                 .order_by("-high_priority", "earliest_timeslot")
+                .prefetch_related("timeslots")
                 .all()[0:limit]
             )
         else:
-            coordinates = USZip5.objects.get(zip5=zip5).coordinates
+            coordinates = lookup_zip5(zip5).coordinates
             if max_dist:
                 filter_args["coordinates__distance_lte"] = (
                     coordinates,
@@ -168,6 +183,60 @@ class DBRecommendationStrategy(BaseRecommendationStrategy):
                     earliest_timeslot=Min("timeslots__start_date"),
                 )
                 .order_by(*order_by_list)
+                .prefetch_related("timeslots")
                 .all()[0:limit]
             )
-        return [e.raw for e in events]
+        return [e.raw_with_display_fields() for e in events]
+
+
+class HybridRecommendationStrategy(BaseRecommendationStrategy):
+    """Serve recommendations from our event tables, falling back to the MA API
+
+    We only call Mobilize America if the local tables can't fill the request or
+    if the last event import is older than SHIFTER_HYBRID_MAX_IMPORT_AGE_SECONDS,
+    so coverage is the same as the MA strategy when imports lag.
+    """
+
+    @classmethod
+    def find_events(
+        cls,
+        limit,
+        zip5=None,
+        max_dist=None,
+        tag_ids=None,
+        timeslot_start=None,
+        timeslot_end=None,
+        event_types=None,
+        is_virtual=False,
+        states=None,
+    ):
+        kwargs = {
+            "zip5": zip5,
+            "max_dist": max_dist,
+            "tag_ids": tag_ids,
+            "timeslot_start": timeslot_start,
+            "timeslot_end": timeslot_end,
+            "event_types": event_types,
+            "is_virtual": is_virtual,
+            "states": states,
+        }
+        last_import = last_event_import_at()
+        max_import_age = settings.SHIFTER_HYBRID_MAX_IMPORT_AGE_SECONDS
+        if last_import is None or time.time() - last_import > max_import_age:
+            logging.info("Serving recommendations from MA: event import is stale")
+            return MobilizeAmericaAPIRecommendationStrategy.find_events(limit, **kwargs)
+
+        try:
+            events = DBRecommendationStrategy.find_events(limit, **kwargs)
+        except USZip5.DoesNotExist:
+            logging.info(f"Serving recommendations from MA: unknown zip5 {zip5}")
+            return MobilizeAmericaAPIRecommendationStrategy.find_events(limit, **kwargs)
+
+        if len(events) < limit:
+            logging.info(
+                f"Serving recommendations from MA: only found {len(events)} local events"
+            )
+            return MobilizeAmericaAPIRecommendationStrategy.find_events(limit, **kwargs)
+
+        logging.info("Serving recommendations from the local event tables")
+        return events
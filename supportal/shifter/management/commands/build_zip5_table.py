@@ -0,0 +1,64 @@
+import csv
+import gzip
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from supportal.shifter.models import USZip5
+from supportal.shifter.zip5_table import (
+    Zip5Record,
+    Zip5Table,
+    reset_zip5_table,
+    write_zip5_table,
+)
+
+
+def _float_or_none(value):
+    return float(value) if value else None
+
+
+def zip5_records_from_csv(fpath):
+    with gzip.open(fpath, "rt") as f:
+        for line in csv.DictReader(f):
+            yield Zip5Record(
+                zip5=line["zip5"],
+                city=line["city"],
+                state=line["state"],
+                latitude=_float_or_none(line["latitude"]),
+                longitude=_float_or_none(line["longitude"]),
+            )
+
+
+def zip5_records_from_db():
+    for zip_obj in USZip5.objects.all().order_by("zip5").iterator():
+        yield Zip5Record.from_model(zip_obj)
+
+
+class Command(BaseCommand):
+    help = "Build the binary zip5 lookup table from the DB or a zip5 csv"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            nargs="?",
+            default=settings.SHIFTER_ZIP5_TABLE_PATH,
+            help="Where to write the table, defaults to SHIFTER_ZIP5_TABLE_PATH",
+        )
+        parser.add_argument(
+            "--file",
+            nargs="?",
+            default=None,
+            help="Gzipped zip5 csv (see import_us_zip5s), reads USZip5 if unset",
+        )
+
+    def handle(self, *args, **options):
+        output = options.get("output") or settings.SHIFTER_ZIP5_TABLE_PATH
+        if not output:
+            raise CommandError(
+                "--output is required if SHIFTER_ZIP5_TABLE_PATH is unset"
+            )
+        fpath = options.get("file")
+        records = zip5_records_from_csv(fpath) if fpath else zip5_records_from_db()
+        write_zip5_table(output, records)
+        reset_zip5_table()
+        return f"Wrote {len(Zip5Table.load(output))} zips to {output}"
@@ -0,0 +1,44 @@
+import logging
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from supportal.shifter.signup_outbox import DrainInProgress, drain_signup_outbox
+
+
+class Command(BaseCommand):
+    help = "Send EventSignups saved in outbox mode to Mobilize America"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, nargs="?", help="Number of signups to send"
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=20,
+            help="Number of signups to send before saving their results",
+        )
+        parser.add_argument(
+            "--time_budget",
+            type=int,
+            default=settings.SHIFTER_SIGNUP_OUTBOX_DRAIN_SECONDS,
+            help="Seconds after which no new batch is started, 0 for no limit",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.SHIFTER_SIGNUP_OUTBOX:
+            logging.info("SHIFTER_SIGNUP_OUTBOX is off, not draining")
+            return "Signup outbox is off"
+        logging.info("Draining the signup outbox")
+        try:
+            sent, failed = drain_signup_outbox(
+                limit=options.get("limit"),
+                batch_size=options.get("batch_size") or 20,
+                time_budget=options.get("time_budget"),
+            )
+        except DrainInProgress:
+            # The next scheduled run picks up whatever that drain leaves
+            logging.info("Another drain of the signup outbox is in progress")
+            return "Another drain is in progress"
+        return f"Sent {sent} signups, {failed} failed"
@@ -0,0 +1,25 @@
+import logging
+
+from django.core.management import BaseCommand
+
+from supportal.shifter.request_log_buffer import (
+    dropped_request_log_count,
+    flush_request_logs,
+)
+
+
+class Command(BaseCommand):
+    help = "Write buffered RecommendedEventRequestLogs to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=500,
+            help="Number of logs to write per INSERT",
+        )
+
+    def handle(self, *args, **options):
+        logging.info("Flushing buffered recommendation request logs")
+        written = flush_request_logs(batch_size=options.get("batch_size") or 500)
+        return f"Wrote {written} logs, {dropped_request_log_count()} dropped in total"
@@ -1,7 +1,11 @@
 import logging
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import timedelta
 
+from django.conf import settings
 from django.core.management import BaseCommand
+from django.db.models import Q
 from django.utils import timezone
 
 from supportal.services.mobilize_america import (
@@ -9,42 +13,65 @@ from supportal.services.mobilize_america import (
     VISIBILITY_TYPES,
     get_global_client,
 )
-from supportal.shifter.models import MobilizeAmericaEvent
+from supportal.shifter.caching import (
+    bump_event_cache_generation,
+    record_event_import,
+)
+from supportal.shifter.models import MobilizeAmericaEvent, MobilizeAmericaEventImport
 
 # from ew_common.telemetry import telemetry  # isort:skip
 
 MA_EVENT_GET_MAX = 1000
 EVENT_PER_PAGE = 20
 
+# How a page was requested, which decides how we find the pages after it
+_FIRST_PAGE = "first"
+_PAGE = "page"
+_NEXT_LINK = "next"
+
 
 class Command(BaseCommand):
     help = "Import all mobilize america"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Fetch every future event rather than only recently updated ones",
+        )
+
     def handle(self, *args, **options):
         logging.info(f"Starting Mobilize America event import")
-        event_count = 0
+        run = MobilizeAmericaEventImport(mode=MobilizeAmericaEventImport.FULL)
+        if not options.get("full"):
+            run.updated_since = self.__incremental_watermark()
+            if run.updated_since is not None:
+                run.mode = MobilizeAmericaEventImport.INCREMENTAL
+        run.save()
+        logging.info(f"Running a {run.mode} import, updated since {run.updated_since}")
+
+        state_ids_by_code = MobilizeAmericaEvent.objects.state_ids_by_code()
+        created_events = defaultdict(list)
+        updated_events = defaultdict(list)
+        events_per_visibility = defaultdict(int)
+        pages_per_visibility = defaultdict(int)
+
+        for visibility, page in self.__fetch_pages(run.updated_since):
+            logging.info(f"{visibility} PAGE: {pages_per_visibility[visibility]}")
+            pages_per_visibility[visibility] += 1
+            events_per_visibility[visibility] += len(page["data"])
+            created, updated = MobilizeAmericaEvent.objects.bulk_upsert_from_json(
+                page["data"], state_ids_by_code, generation=run.id
+            )
+            created_events[visibility].extend(str(event_id) for event_id in created)
+            updated_events[visibility].extend(str(event_id) for event_id in updated)
 
         for visibility in VISIBILITY_TYPES:
-            created_events = []
-            updated_events = []
-            logging.info(f"Indexing {visibility} events")
-            params = {"timeslot_start": "gte_now", "visibility": visibility}
-            res = get_global_client().list_organization_events(params=params)
-            page_count = 0
-            events_for_visibiity = 0
-            for page in res:
-                logging.info(f"PAGE: {page_count}")
-                page_count += 1
-                for event in page["data"]:
-                    events_for_visibiity += 1
-                    shifter_event, created = MobilizeAmericaEvent.objects.update_or_create_from_json(
-                        event
-                    )
-                    if created:
-                        created_events.append(str(shifter_event.id))
-                    else:
-                        updated_events.append(str(shifter_event.id))
-            event_count += events_for_visibiity
+            page_count = pages_per_visibility[visibility]
+            events_for_visibiity = events_per_visibility[visibility]
+            run.page_count += page_count
+            run.created_count += len(created_events[visibility])
+            run.updated_count += len(updated_events[visibility])
             if events_for_visibiity == MA_EVENT_GET_MAX:
                 # telemetry.event(
                 #     "Shifter Mobilize America Event Import at 1000",
@@ -52,19 +79,113 @@ class Command(BaseCommand):
                 #     visibility=visibility,
                 #     event_count=events_for_visibiity,
                 # )
-            created_event_ids_string = ", ".join(created_events)
+            created_event_ids_string = ", ".join(created_events[visibility])
             logging.info(
                 f"Created the following {visibility} events: {created_event_ids_string}"
             )
-            updated_event_ids_string = ", ".join(updated_events)
+            updated_event_ids_string = ", ".join(updated_events[visibility])
             logging.info(
                 f"Updated the following {visibility} events: {updated_event_ids_string}"
             )
+        event_count = sum(events_per_visibility.values())
 
-        # Find all the events that were not updated in the last 20 minutes
-        # and mark them as inactive in the database
-        updated_at_cut_off = timezone.now() - timedelta(minutes=20)
-        MobilizeAmericaEvent.objects.filter(updated_at__lte=updated_at_cut_off).update(
-            is_active=False
-        )
+        if run.mode == MobilizeAmericaEventImport.FULL:
+            run.deactivated_count = self.__deactivate_missing_events(run)
+
+        if run.created_count or run.updated_count or run.deactivated_count:
+            bump_event_cache_generation()
+        record_event_import()
+
+        run.event_count = event_count
+        run.succeeded = True
+        run.finished_at = timezone.now()
+        run.save()
         return f"Loaded events: {event_count}"
+
+    @staticmethod
+    def __fetch_pages(updated_since):
+        """Yield (visibility, page) for every page of events to import
+
+        Pages are fetched by a bounded pool of threads, both visibilities at
+        once, while this thread writes the pages that have already arrived.
+        """
+        client = get_global_client()
+        max_workers = settings.SHIFTER_EVENT_IMPORT_MA_CONCURRENCY
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            for visibility in VISIBILITY_TYPES:
+                logging.info(f"Indexing {visibility} events")
+                params = {"timeslot_start": "gte_now", "visibility": visibility}
+                if updated_since is not None:
+                    params["updated_since"] = int(updated_since.timestamp())
+                future = executor.submit(client.get_organization_events_page, params)
+                pending[future] = (visibility, _FIRST_PAGE)
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        visibility, kind = pending.pop(future)
+                        page = future.result()
+                        urls, next_kind = [], _PAGE
+                        if kind == _FIRST_PAGE:
+                            urls = client.remaining_page_urls(page)
+                            if urls is None:
+                                # can't tell how many pages there are
+                                urls, next_kind = [page["next"]], _NEXT_LINK
+                        elif kind == _NEXT_LINK and page.get("next"):
+                            urls, next_kind = [page["next"]], _NEXT_LINK
+                        for url in urls:
+                            next_page = executor.submit(client.get_page, url)
+                            pending[next_page] = (visibility, next_kind)
+                        yield visibility, page
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    @staticmethod
+    def __deactivate_missing_events(run):
+        """Deactivate events that this full run and the previous one both missed
+
+        A full run sees every future event, so anything it doesn't see is in
+        the past or was deleted in Mobilize America, unless the run just missed
+        it (e.g. pages shifting while we fetched them). Incremental runs don't
+        refetch unchanged events, so we wait for a second full run to miss an
+        event before deactivating it. Events no import has seen yet are
+        deactivated right away.
+        """
+        missing = Q(last_seen_generation__isnull=True)
+        previous_full = (
+            MobilizeAmericaEventImport.objects.filter(
+                mode=MobilizeAmericaEventImport.FULL, succeeded=True
+            )
+            .exclude(id=run.id)
+            .order_by("-id")
+            .first()
+        )
+        if previous_full is not None:
+            missing |= Q(last_seen_generation__lt=previous_full.id)
+        return (
+            MobilizeAmericaEvent.objects.filter(is_active=True)
+            .filter(missing)
+            .update(is_active=False)
+        )
+
+    @staticmethod
+    def __incremental_watermark():
+        """Where an incremental import should start, or None if it should be full"""
+        successful_runs = MobilizeAmericaEventImport.objects.filter(succeeded=True)
+        last_full = (
+            successful_runs.filter(mode=MobilizeAmericaEventImport.FULL)
+            .order_by("-created_at")
+            .first()
+        )
+        full_sweep_due = timezone.now() - timedelta(
+            seconds=settings.SHIFTER_EVENT_IMPORT_FULL_SWEEP_SECONDS
+        )
+        if last_full is None or last_full.created_at < full_sweep_due:
+            return None
+        last_run = successful_runs.order_by("-created_at").first()
+        # overlap runs a little in case our clock is ahead of Mobilize America's
+        return last_run.created_at - timedelta(
+            seconds=settings.SHIFTER_EVENT_IMPORT_WATERMARK_OVERLAP_SECONDS
+        )
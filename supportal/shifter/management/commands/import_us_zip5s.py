@@ -60,6 +60,7 @@ class Command(BaseCommand):
                     accuracy=accuracy,
                     coordinates=coordinates,
                 )
+        USZip5.update_early_state_distances()
         count = USZip5.objects.all().count()
         if count < min_expected:
             raise Exception(f"Wrote fewer zips than expected ({count}), rolling back")
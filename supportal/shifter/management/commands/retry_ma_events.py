@@ -1,10 +1,11 @@
 import logging
 from datetime import timedelta
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.utils import timezone
 
 from supportal.shifter.models import EventSignup
+from supportal.shifter.signup_outbox import DrainInProgress, drain_signup_outbox
 
 
 class Command(BaseCommand):
@@ -37,18 +38,12 @@ class Command(BaseCommand):
         if not_sent:
             failed_events = failed_events.filter(ma_response__isnull=True)
 
-        if limit:
-            failed_events = failed_events[:limit]
-
-        events_successfull_resyncd_count = 0
-        for event in failed_events:
-            success, _ = event.sync_to_mobilize_america()
-            if success:
-                logging.info(f"Successfully sent signup with id {event.id} to MA")
-                events_successfull_resyncd_count += 1
-            else:
-                logging.info(f"Still unable to send signup {event.id} to MA")
-            event.retried_at = timezone.now()
-            event.save()
-
+        try:
+            events_successfull_resyncd_count, _ = drain_signup_outbox(
+                failed_events, limit=limit
+            )
+        except DrainInProgress:
+            raise CommandError(
+                "A drain of the signup outbox is in progress, try again once it's done"
+            )
         return f"Resent {events_successfull_resyncd_count} signups"
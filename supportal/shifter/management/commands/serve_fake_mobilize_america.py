@@ -0,0 +1,85 @@
+import logging
+
+from django.core.management import BaseCommand
+
+from supportal.services.fake_mobilize_america import (
+    FakeMobilizeAmericaServer,
+    FaultConfig,
+    generate_events,
+)
+
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for the Mobilize America API for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+        parser.add_argument(
+            "--organization_id",
+            type=int,
+            default=1,
+            help="Use the same value as MOBILIZE_AMERICA_ORG_ID",
+        )
+        parser.add_argument(
+            "--events", type=int, default=5000, help="Number of events to generate"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for events and injected faults"
+        )
+        parser.add_argument("--page_size", type=int, default=25)
+        parser.add_argument(
+            "--latency_ms", type=float, default=0, help="Delay for every response"
+        )
+        parser.add_argument(
+            "--latency_jitter_ms",
+            type=float,
+            default=0,
+            help="Random extra delay of up to this much for every response",
+        )
+        parser.add_argument(
+            "--error_rate",
+            type=float,
+            default=0,
+            help="Fraction of requests that fail with a 500",
+        )
+        parser.add_argument(
+            "--rate_limit_every",
+            type=float,
+            default=0,
+            help="Seconds between bursts of 429s",
+        )
+        parser.add_argument(
+            "--rate_limit_burst",
+            type=float,
+            default=0,
+            help="Seconds every burst of 429s lasts",
+        )
+
+    def handle(self, *args, **options):
+        faults = FaultConfig(
+            latency_ms=options["latency_ms"],
+            latency_jitter_ms=options["latency_jitter_ms"],
+            error_rate=options["error_rate"],
+            rate_limit_every_seconds=options["rate_limit_every"],
+            rate_limit_burst_seconds=options["rate_limit_burst"],
+        )
+        server = FakeMobilizeAmericaServer(
+            (options["host"], options["port"]),
+            generate_events(options["events"], seed=options["seed"]),
+            organization_id=options["organization_id"],
+            faults=faults,
+            page_size=options["page_size"],
+            seed=options["seed"],
+        )
+        logging.info(
+            f"Serving {options['events']} fake Mobilize America events at "
+            f"{server.url}, set MOBILIZE_AMERICA_BASE_URL to use it"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return f"Served {server.request_count} requests"
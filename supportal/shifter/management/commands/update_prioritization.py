@@ -1,9 +1,12 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.core.management import BaseCommand
 
 from supportal.services.google_sheets_service import GoogleSheetsClient
+from supportal.shifter.caching import bump_event_cache_generation
 from supportal.shifter.models import MAX_INTEGER_SIZE, MobilizeAmericaEvent, State
 
 
@@ -12,6 +15,26 @@ PRIORITIZATIONS_TAB = "prioritizations"
 MA_EVENT_ID_COLUMN = "ma_event_id"
 PRIORITIZATION_COLUMN = "prioritization"
 
+# How many state sheets are fetched at once
+SHEET_FETCH_CONCURRENCY = 4
+
+# The sheets client isn't thread-safe, so each worker gets its own
+_sheets_clients = threading.local()
+
+
+def _get_sheets_client():
+    if getattr(_sheets_clients, "client", None) is None:
+        _sheets_clients.client = GoogleSheetsClient(settings.GOOGLE_DOCS_CREDENTIALS)
+    return _sheets_clients.client
+
+
+def _fetch_prioritizations(prioritization_doc):
+    return _get_sheets_client().get_values_from_sheet(
+        url=prioritization_doc,
+        tab_name=PRIORITIZATIONS_TAB,
+        columns=[MA_EVENT_ID_COLUMN, PRIORITIZATION_COLUMN],
+    )
+
 
 class Command(BaseCommand):
     help = "Get the prioritizations from the state sheets"
@@ -19,31 +42,37 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         logging.info(f"Starting to update prioritizations")
 
-        states_with_prioritization = State.objects.filter(
-            use_prioritization_doc=True, prioritization_doc__isnull=False
+        states_with_prioritization = list(
+            State.objects.filter(
+                use_prioritization_doc=True, prioritization_doc__isnull=False
+            )
         )
 
-        google_sheets_client = GoogleSheetsClient(settings.GOOGLE_DOCS_CREDENTIALS)
-        for state in states_with_prioritization:
-            prioritizations = google_sheets_client.get_values_from_sheet(
-                url=state.prioritization_doc,
-                tab_name=PRIORITIZATIONS_TAB,
-                columns=[MA_EVENT_ID_COLUMN, PRIORITIZATION_COLUMN],
+        with ThreadPoolExecutor(max_workers=SHEET_FETCH_CONCURRENCY) as executor:
+            sheets = executor.map(
+                _fetch_prioritizations,
+                [state.prioritization_doc for state in states_with_prioritization],
             )
+            # map() keeps the order of the states, so an event listed in more
+            # than one sheet gets the value from the last one, as it used to
+            state_prioritizations = {}
+            for prioritizations in sheets:
+                for prioritization in prioritizations:
+                    event_id = prioritization[MA_EVENT_ID_COLUMN]
+                    state_prioritization_value = prioritization[PRIORITIZATION_COLUMN]
+
+                    if isinstance(event_id, int):
+                        if (
+                            isinstance(state_prioritization_value, str)
+                            and state_prioritization_value.strip() == ""
+                        ) or state_prioritization_value > 10:
+                            state_prioritization_value = MAX_INTEGER_SIZE
+                        state_prioritizations[event_id] = state_prioritization_value
+
+        updated = MobilizeAmericaEvent.objects.set_state_prioritizations(
+            state_prioritizations, [state.id for state in states_with_prioritization]
+        )
+        logging.info(f"Updated the prioritization of {updated} events")
 
-            for prioritization in prioritizations:
-                event_id = prioritization[MA_EVENT_ID_COLUMN]
-                state_prioritization_value = prioritization[PRIORITIZATION_COLUMN]
-
-                if isinstance(event_id, int):
-                    if (
-                        isinstance(state_prioritization_value, str)
-                        and state_prioritization_value.strip() == ""
-                    ) or state_prioritization_value > 10:
-                        state_prioritization_value = MAX_INTEGER_SIZE
-                    event = MobilizeAmericaEvent.objects.filter(id=event_id).first()
-                    if event:
-                        event.state_prioritization = state_prioritization_value
-                        event.save()
-
-        return f"Priotized {states_with_prioritization.count()} states"
+        bump_event_cache_generation()
+        return f"Priotized {len(states_with_prioritization)} states"
@@ -4,6 +4,10 @@ from django.conf import settings
 from django.core.management import BaseCommand
 
 from supportal.services.google_sheets_service import GoogleSheetsClient
+from supportal.shifter.caching import (
+    bump_event_cache_generation,
+    bump_state_prioritization_version,
+)
 from supportal.shifter.models import MobilizeAmericaEvent, State
 
 STATE_CODE_COLUMN_NAME = "STATE"
@@ -37,4 +41,6 @@ class Command(BaseCommand):
                     use_prioritization_doc=should_use_doc, prioritization_doc=doc_url
                 )
 
+        bump_state_prioritization_version()
+        bump_event_cache_generation()
         return f"Updated {len(state_metas)} metas"
@@ -1,12 +1,11 @@
 import itertools
 import logging
 import urllib
-from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
 
 import pytz
 
-import zipcodes
 from supportal.services.mobilize_america import PUBLIC_VISIBILITY
 
 __MA_FIELD_WHITELIST = {
@@ -35,98 +34,150 @@ def sanitize_event_payload(payload):
     This method is required because we fetch events using the authenticated GET
     /events API, which can return private fields that we don't want to serve
     """
-    location = payload.pop("location", None)
-    address_vis = payload.pop("address_visibility", None)
-    sanitized = {k: v for k, v in payload.items() if k in __MA_FIELD_WHITELIST}
-    if address_vis == PUBLIC_VISIBILITY:
-        sanitized["location"] = location
-    elif location and location.get("postal_code"):
-        matching_codes = zipcodes.matching(location.get("postal_code"))
-        if len(matching_codes) > 0:
-            zip_code_data = matching_codes[0]
-            location_from_zip = {
-                "location": {
-                    "longitude": float(zip_code_data["long"]),
-                    "latitude": float(zip_code_data["lat"]),
-                }
-            }
-            sanitized["location"] = location_from_zip
-
+    sanitized = {
+        k: v
+        for k, v in payload.items()
+        if k in __MA_FIELD_WHITELIST and k != "location"
+    }
+    __add_sanitized_location(payload, sanitized)
     return sanitized
 
 
-def filter_timeslots_for_time(event, timeslot_start_after_utc, timeslot_end_before_utc):
-    event_dupe = deepcopy(event)
-    tz = pytz.timezone(event["timezone"])
-
-    timeslots_within_range = []
-    for timeslot in event_dupe["timeslots"]:
-        timeslot_start = __timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
-        timeslot_end = __timestamp_to_datetime_in_zone(timeslot["end_date"], tz)
-        is_valid_timeslot = True
+def prepare_event_for_mdata(
+    event, utm_source, timeslot_start_after_utc=None, timeslot_end_before_utc=None
+):
+    """Single-pass equivalent of the recommendation payload pipeline
 
-        if timeslot_start_after_utc:
-            is_valid_timeslot = timeslot_start > timeslot_start_after_utc
-        if timeslot_end_before_utc:
-            is_valid_timeslot = is_valid_timeslot and (
-                timeslot_end < timeslot_end_before_utc
-            )
+    Produces the same output as the multi-pass pipeline it replaced (kept in
+    supportal/tests/shifter/event_preparation_benchmark.py), without copying the
+    raw event. Display fields precomputed at import time (see mdata_display_fields)
+    are used as-is and only computed here for events that don't have them, e.g.
+    ones fetched live from Mobilize America. Returns None if none of the event's
+    timeslots can be signed up for.
+    """
+    tz = None
+    times_synopsis = event.get("times_synopsis")
+    open_local_starts = []
+    timeslots = []
+    for timeslot in event["timeslots"]:
+        if timeslot["is_full"]:
+            continue
+        local_start = None
+        if not times_synopsis:
+            # The synopsis describes all open timeslots, not just the ones in range
+            tz = tz or pytz.timezone(event["timezone"])
+            local_start = __timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
+            open_local_starts.append(local_start)
+
+        if timeslot_start_after_utc and not (
+            __timestamp_to_utc_datetime(timeslot["start_date"])
+            > timeslot_start_after_utc
+        ):
+            continue
+        if timeslot_end_before_utc and not (
+            __timestamp_to_utc_datetime(timeslot["end_date"]) < timeslot_end_before_utc
+        ):
+            continue
+
+        if timeslot.get("formatted_time") and timeslot.get("local_start_time"):
+            timeslots.append(timeslot)
+            continue
+        if local_start is None:
+            tz = tz or pytz.timezone(event["timezone"])
+            local_start = __timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
+        timeslots.append(
+            {
+                **timeslot,
+                "formatted_time": __format_event_start_date_and_time(local_start),
+                "local_start_time": local_start.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+        )
 
-        if is_valid_timeslot:
-            timeslots_within_range.append(timeslot)
+    if not timeslots:
+        return None
 
-    event_dupe["timeslots"] = timeslots_within_range
-    return event_dupe
+    prepared = sanitize_event_payload(event)
+    prepared["timeslots"] = timeslots
+    prepared["times_synopsis"] = times_synopsis or __format_times_synopsis(
+        open_local_starts
+    )
+    if "browser_url" in event:
+        prepared["browser_url"] = __add_utm_source(event["browser_url"], utm_source)
+    return prepared
 
 
-def remove_full_timeslots(event):
-    event_dupe = deepcopy(event)
+def mdata_display_fields(event):
+    """Compute the mdata display fields that only depend on the event itself
 
-    open_timeslots = []
-    for timeslot in event_dupe["timeslots"]:
+    Returns the event's times synopsis and a dict mapping each timeslot id to
+    its (formatted_time, local_start_time). These are stored at import time so
+    that serving recommendations doesn't have to do any timezone formatting.
+    """
+    if not event.get("timezone"):
+        return "", {}
+    tz = pytz.timezone(event["timezone"])
+    open_local_starts = []
+    timeslot_fields = {}
+    for timeslot in event.get("timeslots", []):
+        local_start = __timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
         if not timeslot["is_full"]:
-            open_timeslots.append(timeslot)
+            open_local_starts.append(local_start)
+        timeslot_fields[timeslot["id"]] = (
+            __format_event_start_date_and_time(local_start),
+            local_start.strftime("%Y-%m-%dT%H:%M:%S"),
+        )
+    return __format_times_synopsis(open_local_starts), timeslot_fields
+
 
-    event_dupe["timeslots"] = open_timeslots
-    return event_dupe
+def __add_sanitized_location(payload, sanitized):
+    """Only expose exact locations for events with public addresses"""
+    location = payload.get("location")
+    if payload.get("address_visibility") == PUBLIC_VISIBILITY:
+        sanitized["location"] = location
+    elif location and location.get("postal_code"):
+        centroid = zip5_centroid(str(location.get("postal_code"))[:5])
+        if centroid is not None:
+            latitude, longitude = centroid
+            sanitized["location"] = {
+                "location": {"longitude": longitude, "latitude": latitude}
+            }
 
 
-def add_extras_for_mdata(event, utm_source):
-    """Given raw Mobilize America event dict, adds extra useful fields.
+@lru_cache(maxsize=50000)
+def zip5_centroid(zip5):
+    """(latitude, longitude) of a zip5 from our zip data, or None if unknown
 
-    - Adds "formatted_time" to each timeslot.
-    - Adds "times_synopsis" to the top-level event synopsizing all timeslots.
-    - Adds utm_source to browser URL.
+    Misses are cached too: they're mostly typos and non-US postal codes.
     """
-    tz = pytz.timezone(event["timezone"])
-    for timeslot in event["timeslots"]:
-        local_timestamp = __timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
-        timeslot["formatted_time"] = __format_event_start_date_and_time(local_timestamp)
-        timeslot["local_start_time"] = local_timestamp.strftime("%Y-%m-%dT%H:%M:%S")
-    event["times_synopsis"] = __format_event_times_synopsis(
-        event["timeslots"], pytz.timezone(event["timezone"])
-    )
-    event["browser_url"] = __add_utm_source(event["browser_url"], utm_source)
-    return event
+    # imported here because models depends on this module
+    from supportal.shifter.models import USZip5
+    from supportal.shifter.zip5_table import lookup_zip5
+
+    try:
+        record = lookup_zip5(zip5)
+    except USZip5.DoesNotExist:
+        return None
+    if record.latitude is None or record.longitude is None:
+        return None
+    return record.latitude, record.longitude
 
 
 def __timestamp_to_datetime_in_zone(timestamp, tz):
     return pytz.utc.localize(datetime.utcfromtimestamp(timestamp)).astimezone(tz)
 
 
-def __format_event_times_synopsis(timeslots, tz):
-    """Given an event's timeslots and timezone, returns string summarizing dates and times."""
-    timeslots_by_date = itertools.groupby(
-        timeslots, lambda x: __timestamp_to_datetime_in_zone(x["start_date"], tz).date()
-    )
+def __timestamp_to_utc_datetime(timestamp):
+    return pytz.utc.localize(datetime.utcfromtimestamp(timestamp))
+
+
+def __format_times_synopsis(local_starts):
+    """Given localized timeslot start times, returns string summarizing dates and times."""
+    starts_by_date = itertools.groupby(local_starts, lambda x: x.date())
     date_synopses = []
     times_summaries = []
     formatted_dates = []
-    for d, day_timeslots in timeslots_by_date:
-        times = []
-        for timeslot in day_timeslots:
-            timeslot_start = __timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
-            times.append(__format_event_start_time(timeslot_start))
+    for d, day_starts in starts_by_date:
+        times = [__format_event_start_time(start) for start in day_starts]
         times_summary = __join_with_or(times)
         formatted_date = __format_date(d)
         date_synopses.append(f"{times_summary} on {formatted_date}")
@@ -1,14 +1,18 @@
+import hashlib
+import json
 from datetime import datetime, timezone
 
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.geos import Point
 from django.contrib.postgres.fields import ArrayField, JSONField
 from django.core.exceptions import ValidationError
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from django.db.models import Q
 from django.utils import timezone
 from enumfields import EnumIntegerField
 from localflavor.us.models import USStateField, USZipCodeField
 from phonenumber_field.modelfields import PhoneNumberField
+from psycopg2.extras import Json, execute_values
 
 from supportal.app.models.base_model_mixin import BaseModelMixin
 from supportal.services.mobilize_america import (
@@ -18,9 +22,12 @@ from supportal.services.mobilize_america import (
     get_global_client,
 )
 from supportal.shifter.common.error_codes import ErrorCodes
+from supportal.shifter.mobilize_america_helpers import mdata_display_fields
 
 MAX_INTEGER_SIZE = 2147483647
 
+EARLY_STATES = ["IA", "NH", "NV", "SC"]
+
 
 class EventSignup(BaseModelMixin):
     email = models.EmailField(blank=True)
@@ -43,8 +50,15 @@ class EventSignup(BaseModelMixin):
     zip5 = USZipCodeField(blank=True)
     retried_at = models.DateTimeField(null=True)
     heap_id = models.CharField(max_length=1024, null=True)
+    # Saved with SHIFTER_SIGNUP_OUTBOX on and waiting for drain_signup_outbox
+    # to send it to MA
+    ma_sync_deferred = models.BooleanField(default=False)
 
-    def sync_to_mobilize_america(self):
+    def send_to_mobilize_america(self):
+        """Create the signup's attendances in MA, without saving the result
+
+        Doesn't touch the database, so it's safe to call from other threads.
+        """
         if not self.ma_creation_successful and (self.email and self.zip5):
             try:
                 referrer = Referrer(utm_source=self.source) if self.source else None
@@ -66,6 +80,11 @@ class EventSignup(BaseModelMixin):
             except MobilizeAmericaAPIException as e:
                 self.ma_response = e.response
                 self.ma_creation_successful = False
+        return self.ma_creation_successful, self.ma_response
+
+    def sync_to_mobilize_america(self):
+        if not self.ma_creation_successful and (self.email and self.zip5):
+            self.send_to_mobilize_america()
             self.save()
         return self.ma_creation_successful, self.ma_response
 
@@ -87,7 +106,7 @@ class State(BaseModelMixin):
 
 class MobilizeAmericaEventManager(models.Manager):
     @staticmethod
-    def _timeslot_from_json(event_id, j):
+    def _timeslot_from_json(event_id, j, display_fields):
         ts = MobilizeAmericaTimeslot()
         ts.event_id = event_id
         ts.end_date = _convert_ma_timestamp(j["end_date"])
@@ -95,47 +114,246 @@ class MobilizeAmericaEventManager(models.Manager):
         ts.id = j["id"]
         ts.is_full = j["is_full"]
         ts.raw = j
+        ts.formatted_time, ts.local_start_time = display_fields.get(j["id"], ("", ""))
         return ts
 
-    @transaction.atomic
-    def update_or_create_from_json(self, payload):
+    @staticmethod
+    def _fields_from_json(payload):
+        """Model fields derived from an MA payload, other than state and raw"""
         loc = payload.get("location")
         coordinates = None
         if loc is not None and "location" in loc:
             lat = loc["location"].get("latitude")
             lng = loc["location"].get("longitude")
             coordinates = Point(lng, lat, srid=4326)
-        state = None
+        return {
+            "title": payload.get("title"),
+            "event_type": payload.get("event_type"),
+            "visibility": payload.get("visibility"),
+            "high_priority": payload.get("high_priority"),
+            "is_virtual": loc is None,
+            "coordinates": coordinates,
+            "tag_ids": [t["id"] for t in payload.get("tags", [])],
+            "modified_date": _convert_ma_timestamp(payload.get("modified_date")),
+        }
+
+    @staticmethod
+    def _state_code_from_json(payload):
+        loc = payload.get("location")
         if loc is not None and "region" in loc:
-            state_code = loc["region"]
-            state, _ = State.objects.get_or_create(state_code=state_code)
-        event, created = self.update_or_create(
-            id=payload["id"],
-            defaults={
-                "title": payload.get("title"),
-                "event_type": payload.get("event_type"),
-                "visibility": payload.get("visibility"),
-                "high_priority": payload.get("high_priority"),
-                "is_virtual": loc is None,
-                "coordinates": coordinates,
-                "tag_ids": [t["id"] for t in payload.get("tags", [])],
-                "modified_date": _convert_ma_timestamp(payload.get("modified_date")),
-                "raw": payload,
-                "state": state,
-                "is_active": True,
-            },
+            return loc["region"]
+        return None
+
+    def update_or_create_from_json(self, payload, generation=None):
+        """Insert or update a single MA event payload, see bulk_upsert_from_json
+
+        Returns the event and whether it was created.
+        """
+        created_ids, _ = self.bulk_upsert_from_json([payload], generation=generation)
+        return self.get(id=payload["id"]), payload["id"] in created_ids
+
+    @transaction.atomic
+    def bulk_upsert_from_json(self, payloads, state_ids_by_code=None, generation=None):
+        """Insert or update a page of MA event payloads in a few statements
+
+        Pass the same `state_ids_by_code` dict (see state_ids_by_code) for every
+        page of an import to avoid reloading States. Every event in payloads
+        is stamped with `generation`, the id of the MobilizeAmericaEventImport
+        that saw it. Events whose payload hasn't changed since they were last
+        written only get that stamp, and only timeslots that were added,
+        changed or removed are written.
+
+        Returns lists of the created and the updated event ids, unchanged
+        events are in neither.
+        """
+        # MA can return an event more than once, the last copy wins
+        payloads = list({p["id"]: p for p in payloads}.values())
+        if not payloads:
+            return [], []
+        now = timezone.now()
+
+        content_hashes = {p["id"]: payload_content_hash(p) for p in payloads}
+        unchanged_ids = {
+            event_id
+            for event_id, content_hash, is_active in self.filter(
+                id__in=content_hashes.keys()
+            ).values_list("id", "content_hash", "is_active")
+            if is_active and content_hash == content_hashes[event_id]
+        }
+        if unchanged_ids:
+            if generation is not None:
+                self.filter(id__in=unchanged_ids).update(
+                    last_seen_generation=generation
+                )
+            payloads = [p for p in payloads if p["id"] not in unchanged_ids]
+            if not payloads:
+                return [], []
+
+        if state_ids_by_code is None:
+            state_ids_by_code = self.state_ids_by_code()
+        rows = []
+        timeslots = []
+        for payload in payloads:
+            fields = self._fields_from_json(payload)
+            state_code = self._state_code_from_json(payload)
+            if state_code is not None and state_code not in state_ids_by_code:
+                state, _ = State.objects.get_or_create(state_code=state_code)
+                state_ids_by_code[state_code] = state.id
+            times_synopsis, timeslot_display_fields = mdata_display_fields(payload)
+            coordinates = fields["coordinates"]
+            rows.append(
+                (
+                    payload["id"],
+                    now,
+                    now,
+                    fields["title"],
+                    fields["event_type"],
+                    fields["visibility"],
+                    fields["high_priority"],
+                    fields["is_virtual"],
+                    coordinates.ewkt if coordinates else None,
+                    fields["tag_ids"],
+                    fields["modified_date"],
+                    Json(payload),
+                    state_ids_by_code.get(state_code),
+                    True,
+                    times_synopsis,
+                    content_hashes[payload["id"]],
+                    generation,
+                    MAX_INTEGER_SIZE,
+                )
+            )
+            timeslots.extend(
+                self._timeslot_from_json(payload["id"], j, timeslot_display_fields)
+                for j in payload.get("timeslots", [])
+            )
+
+        with connection.cursor() as cursor:
+            results = execute_values(
+                cursor,
+                _EVENT_UPSERT_SQL.format(table=self.model._meta.db_table),
+                rows,
+                template=_EVENT_UPSERT_TEMPLATE,
+                page_size=len(rows),
+                fetch=True,
+            )
+        created_ids = [event_id for event_id, inserted in results if inserted]
+        updated_ids = [event_id for event_id, inserted in results if not inserted]
+
+        self._sync_timeslots([p["id"] for p in payloads], timeslots, now)
+        return created_ids, updated_ids
+
+    @staticmethod
+    def _sync_timeslots(event_ids, timeslots, now):
+        existing = {
+            ts.id: ts
+            for ts in MobilizeAmericaTimeslot.objects.filter(
+                Q(event_id__in=event_ids) | Q(id__in=[ts.id for ts in timeslots])
+            )
+        }
+        to_create = []
+        to_update = []
+        for ts in timeslots:
+            old = existing.pop(ts.id, None)
+            if old is None:
+                to_create.append(ts)
+            elif any(
+                getattr(old, f) != getattr(ts, f) for f in _TIMESLOT_IMPORT_FIELDS
+            ):
+                ts.updated_at = now
+                to_update.append(ts)
+        # anything left belongs to these events but wasn't in the payloads
+        if existing:
+            MobilizeAmericaTimeslot.objects.filter(id__in=existing.keys()).delete()
+        if to_update:
+            MobilizeAmericaTimeslot.objects.bulk_update(
+                to_update, _TIMESLOT_IMPORT_FIELDS + ["updated_at"]
+            )
+        if to_create:
+            MobilizeAmericaTimeslot.objects.bulk_create(to_create)
+
+    @staticmethod
+    def state_ids_by_code():
+        return dict(State.objects.values_list("state_code", "id"))
+
+    @transaction.atomic
+    def set_state_prioritizations(self, prioritizations, state_ids):
+        """Apply a map of event id -> state_prioritization in bulk
+
+        Events in `state_ids` that aren't in the map are reset to
+        MAX_INTEGER_SIZE. Only rows whose prioritization changes are written,
+        returns the number of rows updated.
+        """
+        updated = 0
+        if prioritizations:
+            with connection.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    _STATE_PRIORITIZATION_UPDATE_SQL.format(
+                        table=self.model._meta.db_table
+                    ),
+                    list(prioritizations.items()),
+                    page_size=len(prioritizations),
+                )
+                updated = cursor.rowcount
+        updated += (
+            self.filter(state_id__in=state_ids)
+            .exclude(id__in=prioritizations.keys())
+            .exclude(state_prioritization=MAX_INTEGER_SIZE)
+            .update(state_prioritization=MAX_INTEGER_SIZE, updated_at=timezone.now())
+        )
+        return updated
+
+
+_TIMESLOT_IMPORT_FIELDS = [
+    "event_id",
+    "end_date",
+    "start_date",
+    "is_full",
+    "raw",
+    "formatted_time",
+    "local_start_time",
+]
+
+# Columns not listed in the DO UPDATE clause (created_at and
+# state_prioritization) keep their values when an event is updated.
+_EVENT_UPSERT_SQL = """
+    INSERT INTO {table} (
+        id, created_at, updated_at, title, event_type, visibility, high_priority,
+        is_virtual, coordinates, tag_ids, modified_date, raw, state_id, is_active,
+        times_synopsis, content_hash, last_seen_generation, state_prioritization
+    ) VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        updated_at = EXCLUDED.updated_at,
+        title = EXCLUDED.title,
+        event_type = EXCLUDED.event_type,
+        visibility = EXCLUDED.visibility,
+        high_priority = EXCLUDED.high_priority,
+        is_virtual = EXCLUDED.is_virtual,
+        coordinates = EXCLUDED.coordinates,
+        tag_ids = EXCLUDED.tag_ids,
+        modified_date = EXCLUDED.modified_date,
+        raw = EXCLUDED.raw,
+        state_id = EXCLUDED.state_id,
+        is_active = EXCLUDED.is_active,
+        times_synopsis = EXCLUDED.times_synopsis,
+        content_hash = EXCLUDED.content_hash,
+        last_seen_generation = COALESCE(
+            EXCLUDED.last_seen_generation, {table}.last_seen_generation
         )
-        if not created:
-            # the update_or_create might do this automatically, but it was hard
-            # to tell so I added it in
-            event.updated_at = timezone.now()
-            event.save()
-            event.timeslots.all().delete()
-        timeslots = [
-            self._timeslot_from_json(event.id, j) for j in payload.get("timeslots", [])
-        ]
-        MobilizeAmericaTimeslot.objects.bulk_create(timeslots)
-        return event, created
+    RETURNING id, (xmax = 0) AS inserted
+"""
+_EVENT_UPSERT_TEMPLATE = (
+    "(%s, %s, %s, %s, %s, %s, %s, %s, ST_GeogFromText(%s), %s::integer[], %s, "
+    "%s, %s, %s, %s, %s, %s, %s)"
+)
+
+_STATE_PRIORITIZATION_UPDATE_SQL = """
+    UPDATE {table} AS e
+    SET state_prioritization = v.state_prioritization, updated_at = NOW()
+    FROM (VALUES %s) AS v (id, state_prioritization)
+    WHERE e.id = v.id AND e.state_prioritization <> v.state_prioritization
+"""
 
 
 class MobilizeAmericaEvent(BaseModelMixin):
@@ -158,6 +376,33 @@ class MobilizeAmericaEvent(BaseModelMixin):
     visibility = models.CharField(null=True, max_length=30, db_index=True)
     state_prioritization = models.IntegerField(default=MAX_INTEGER_SIZE)
     is_active = models.BooleanField(default=True)
+    # mdata display fields, precomputed at import time
+    times_synopsis = models.TextField(blank=True)
+    # see payload_content_hash, imports skip writing events that didn't change
+    content_hash = models.CharField(max_length=40, blank=True)
+    # id of the last MobilizeAmericaEventImport that saw this event, changed or not
+    last_seen_generation = models.IntegerField(null=True, db_index=True)
+
+    def raw_with_display_fields(self):
+        """The raw MA payload with the precomputed mdata display fields added
+
+        Prefetch `timeslots` when calling this on more than one event.
+        """
+        timeslots_by_id = {ts.id: ts for ts in self.timeslots.all()}
+        timeslots = []
+        for j in self.raw.get("timeslots", []):
+            ts = timeslots_by_id.get(j["id"])
+            if ts and ts.formatted_time and ts.local_start_time:
+                j = {
+                    **j,
+                    "formatted_time": ts.formatted_time,
+                    "local_start_time": ts.local_start_time,
+                }
+            timeslots.append(j)
+        payload = {**self.raw, "timeslots": timeslots}
+        if self.times_synopsis:
+            payload["times_synopsis"] = self.times_synopsis
+        return payload
 
 
 class MobilizeAmericaTimeslot(BaseModelMixin):
@@ -172,6 +417,31 @@ class MobilizeAmericaTimeslot(BaseModelMixin):
     is_full = models.BooleanField(default=False)
     raw = JSONField(null=False)
     start_date = models.DateTimeField(null=True)
+    # mdata display fields, precomputed at import time
+    formatted_time = models.CharField(max_length=255, blank=True)
+    local_start_time = models.CharField(max_length=19, blank=True)
+
+
+class MobilizeAmericaEventImport(BaseModelMixin):
+    """One run of import_mobilize_america_events
+
+    created_at is when the run started. Incremental runs only ask Mobilize
+    America for events updated since the last successful run started.
+    """
+
+    FULL = "full"
+    INCREMENTAL = "incremental"
+    MODE_CHOICES = [(FULL, "Full"), (INCREMENTAL, "Incremental")]
+
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES)
+    updated_since = models.DateTimeField(null=True)
+    succeeded = models.BooleanField(default=False, db_index=True)
+    finished_at = models.DateTimeField(null=True)
+    page_count = models.IntegerField(default=0)
+    event_count = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    updated_count = models.IntegerField(default=0)
+    deactivated_count = models.IntegerField(default=0)
 
 
 class USZip5(models.Model):
@@ -184,6 +454,8 @@ class USZip5(models.Model):
     county_fips = models.IntegerField(null=True)
     state = USStateField(blank=True)
     zip5 = USZipCodeField(blank=False, primary_key=True)
+    # early state code -> distance in meters to that state's closest zip5
+    early_state_distances = JSONField(null=True)
 
     @property
     def longitude(self):
@@ -193,6 +465,53 @@ class USZip5(models.Model):
     def latitude(self):
         return self.coordinates.y
 
+    @classmethod
+    def update_early_state_distances(cls):
+        """Precompute every zip5's distance to the closest zip5 in each early state
+
+        The distance from a point to a geography multipoint is the distance to
+        its closest point, so this matches aggregating Min(Distance(...)) over
+        the early state's zips.
+        """
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH early_states AS (
+                    SELECT state, ST_Collect(coordinates::geometry)::geography AS points
+                    FROM {table}
+                    WHERE state = ANY(%s) AND coordinates IS NOT NULL
+                    GROUP BY state
+                ), distances AS (
+                    SELECT z.zip5,
+                        jsonb_object_agg(
+                            e.state, ST_Distance(z.coordinates, e.points)
+                        ) AS distances
+                    FROM {table} z CROSS JOIN early_states e
+                    WHERE z.coordinates IS NOT NULL
+                    GROUP BY z.zip5
+                )
+                UPDATE {table} z
+                SET early_state_distances = distances.distances
+                FROM distances
+                WHERE z.zip5 = distances.zip5
+                """,
+                [EARLY_STATES],
+            )
+
+
+# Bump this when the fields derived from MA payloads change, so that the next
+# import rewrites every event
+_CONTENT_HASH_VERSION = 1
+
+
+def payload_content_hash(payload):
+    """Stable hash of an MA event payload"""
+    canonical = json.dumps(
+        [_CONTENT_HASH_VERSION, payload], sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
 
 def _convert_ma_timestamp(unix_time):
     return datetime.fromtimestamp(unix_time, timezone.utc)
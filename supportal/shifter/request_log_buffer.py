@@ -0,0 +1,143 @@
+"""Buffered writes for RecommendedEventRequestLog
+
+Logging every recommendation request with a synchronous INSERT puts most of the
+public shifter API's write load on the database during mdata blasts. Instead,
+requests push their log records onto a Redis list and the
+flush_recommendation_logs command drains it with multi-row inserts.
+
+Records are only removed from the list once they have been written, so
+delivery is at-least-once: a flush that fails after inserting a batch will
+insert it again on the next run.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from psycopg2.extras import Json, execute_values
+
+from supportal.shifter.models import RecommendedEventRequestLog
+
+BUFFER_KEY = "shifter_request_log_buffer"
+DROPPED_COUNT_KEY = "shifter_request_log_dropped"
+FLUSH_LOCK_KEY = "shifter_request_log_flush_lock"
+# No longer than the flush function's timeout in serverless.yml, so a flush
+# that gets killed doesn't hold up the next scheduled run
+FLUSH_LOCK_TIMEOUT = 60
+# A flush stops starting new batches after this long, well within both the
+# function timeout and the lock, and leaves the rest for the next run
+FLUSH_TIME_BUDGET_SECONDS = 30
+
+_INSERT_COLUMNS = [
+    "created_at",
+    "updated_at",
+    "email",
+    "recommended_ma_event_ids",
+    "request_params",
+    "session_id",
+]
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _record_dropped(count, reason):
+    logging.error(f"Dropped {count} RecommendedEventRequestLog records: {reason}")
+    try:
+        _redis().incr(cache.make_key(DROPPED_COUNT_KEY), count)
+    except Exception:
+        logging.exception("Failed to count dropped RecommendedEventRequestLog records")
+
+
+def buffer_request_log(log):
+    """Queue a RecommendedEventRequestLog to be written by the next flush
+
+    Falls back to saving the log directly if Redis is unavailable.
+    """
+    record = json.dumps(
+        {
+            "created_at": timezone.now(),
+            "email": log.email,
+            "recommended_ma_event_ids": log.recommended_ma_event_ids,
+            "request_params": log.request_params,
+            "session_id": log.session_id,
+        },
+        cls=DjangoJSONEncoder,
+    )
+    try:
+        buffer_length = _redis().rpush(cache.make_key(BUFFER_KEY), record)
+    except Exception:
+        logging.exception("Failed to buffer RecommendedEventRequestLog, saving it")
+        try:
+            log.save()
+        except Exception:
+            _record_dropped(1, "could not buffer or save")
+        return
+
+    max_length = settings.SHIFTER_REQUEST_LOG_BUFFER_MAX_LENGTH
+    if buffer_length > max_length:
+        # Keep the oldest records, the newest ones are the ones we drop
+        _redis().ltrim(cache.make_key(BUFFER_KEY), 0, max_length - 1)
+        _record_dropped(buffer_length - max_length, "buffer is full")
+
+
+def dropped_request_log_count():
+    count = _redis().get(cache.make_key(DROPPED_COUNT_KEY))
+    return int(count) if count else 0
+
+
+def _insert_records(records):
+    rows = []
+    for record in records:
+        rows.append(
+            (
+                record["created_at"],
+                record["created_at"],
+                record["email"] or "",
+                record["recommended_ma_event_ids"],
+                Json(record["request_params"]),
+                record["session_id"] or "",
+            )
+        )
+    with transaction.atomic(), connection.cursor() as cursor:
+        execute_values(
+            cursor,
+            f"INSERT INTO {RecommendedEventRequestLog._meta.db_table} "
+            f"({', '.join(_INSERT_COLUMNS)}) VALUES %s",
+            rows,
+        )
+
+
+def flush_request_logs(batch_size=500, time_budget=FLUSH_TIME_BUDGET_SECONDS):
+    """Write buffered logs to the database, returns the number written"""
+    if not cache.add(FLUSH_LOCK_KEY, True, FLUSH_LOCK_TIMEOUT):
+        logging.info("Another flush of the request log buffer is in progress")
+        return 0
+    redis = _redis()
+    buffer_key = cache.make_key(BUFFER_KEY)
+    written = 0
+    deadline = time.monotonic() + time_budget
+    try:
+        while time.monotonic() < deadline:
+            raw_records = redis.lrange(buffer_key, 0, batch_size - 1)
+            if not raw_records:
+                break
+            records = []
+            for raw_record in raw_records:
+                try:
+                    records.append(json.loads(raw_record))
+                except ValueError:
+                    _record_dropped(1, f"could not decode {raw_record!r}")
+            if records:
+                _insert_records(records)
+            redis.ltrim(buffer_key, len(raw_records), -1)
+            written += len(records)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return written
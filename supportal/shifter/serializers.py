@@ -1,22 +1,20 @@
 import logging
 
 from django.conf import settings
+from django.core.cache import cache
 from localflavor.us.models import USZipCodeField
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.serializers import ModelSerializer
 
 from supportal.services.mobilize_america import PUBLIC_VISIBILITY, get_global_client
+from supportal.shifter.caching import recommendation_cache_key
 from supportal.shifter.event_recommendation_strategies import (
     DBRecommendationStrategy,
+    HybridRecommendationStrategy,
     MobilizeAmericaAPIRecommendationStrategy,
 )
-from supportal.shifter.mobilize_america_helpers import (
-    add_extras_for_mdata,
-    filter_timeslots_for_time,
-    remove_full_timeslots,
-    sanitize_event_payload,
-)
+from supportal.shifter.mobilize_america_helpers import prepare_event_for_mdata
 from supportal.shifter.models import (
     EventSignup,
     MobilizeAmericaEvent,
@@ -24,6 +22,7 @@ from supportal.shifter.models import (
     RecommendedEventRequestLog,
     USZip5,
 )
+from supportal.shifter.request_log_buffer import buffer_request_log
 
 
 class EventSignupSerializer(ModelSerializer):
@@ -67,20 +66,23 @@ class EventSignupSerializer(ModelSerializer):
                 {"detail": "Must include either phone or email or zip5"},
                 code="required_field",
             )
-        obj = super().create(validated_data)
         if not validated_data.get("email") or not validated_data.get("zip5"):
-            return obj
+            return super().create(validated_data)
         # MA doesn't provide a way to limit event attendance creation to public events
         # so we have to check permissions ourselves before syncing.
         # Note: we perform the check here rather than in sync_to_mobilize_america() since
         # there could be legitimate reasons for us to sign people up to private events,
         # we just don't want them to be able to do it themselves through a public API.
+        # It happens before saving, so a rejected signup is never sent later on.
         if settings.MOBILIZE_AMERICA_DEFAULT_VISIBILITY == PUBLIC_VISIBILITY:
             event = MobilizeAmericaEvent.objects.filter(
-                id=obj.ma_event_id, is_active=True
-            )
-            if not event.exists() or event.first().visibility != PUBLIC_VISIBILITY:
+                id=validated_data["ma_event_id"], is_active=True
+            ).first()
+            if event is None or event.visibility != PUBLIC_VISIBILITY:
                 raise NotFound()
+        if settings.SHIFTER_SIGNUP_OUTBOX:
+            return super().create({**validated_data, "ma_sync_deferred": True})
+        obj = super().create(validated_data)
         obj.sync_to_mobilize_america()
         return obj
 
@@ -139,21 +141,63 @@ class RecommendedEventRequestSerializer(serializers.Serializer):
         # Log the raw request, not the converted/validated data
         log.request_params = self.initial_data
 
+        cache_key = recommendation_cache_key(self.__cache_key_params(validated_data))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            log.recommended_ma_event_ids = cached["event_ids"]
+            self.__save_log(log)
+            return cached["events"]
+
         strategy = self.__get_recommendation_strategy(validated_data)
         rbkwargs = {k: v for k, v in validated_data.items() if k in self.__rec_kwargs}
         events = strategy.find_events(validated_data["limit"], **rbkwargs)
         log.recommended_ma_event_ids = [e["id"] for e in events]
+        self.__save_log(log)
+        prepared_events = self.__prepare_events(
+            events,
+            validated_data.get("utm_source"),
+            validated_data.get("timeslot_start"),
+            validated_data.get("timeslot_end"),
+        )
+        cache.set(
+            cache_key,
+            {"event_ids": log.recommended_ma_event_ids, "events": prepared_events},
+            settings.SHIFTER_RECOMMENDATION_CACHE_TIMEOUT,
+        )
+        return prepared_events
+
+    def __save_log(self, log):
+        if settings.SHIFTER_BUFFER_REQUEST_LOGS:
+            buffer_request_log(log)
+            return
         try:
             log.save()
         except Exception as e:
             logging.exception("Failed to save RecommendedEventRequestLog", e)
-        finally:
-            return self.__prepare_events(
-                events,
-                validated_data.get("utm_source"),
-                validated_data.get("timeslot_start"),
-                validated_data.get("timeslot_end"),
-            )
+
+    def __cache_key_params(self, data):
+        """Normalize the validated request so equivalent requests share a cache entry
+
+        Timeslot bounds are floored to the minute: requests made within the same
+        minute will be served the same recommendations.
+        """
+        return {
+            "zip5": None if data.get("is_virtual") else data.get("zip5"),
+            "event_types": sorted(set(data.get("event_types") or [])),
+            "is_virtual": data.get("is_virtual"),
+            "limit": data.get("limit"),
+            "max_dist": data.get("max_dist"),
+            "states": sorted(set(data.get("states") or [])),
+            "strategy": data.get("strategy"),
+            "tag_ids": sorted(set(data.get("tag_ids") or [])),
+            "timeslot_start": self.__round_to_minute(data.get("timeslot_start")),
+            "timeslot_end": self.__round_to_minute(data.get("timeslot_end")),
+            "utm_source": data.get("utm_source"),
+        }
+
+    @staticmethod
+    def __round_to_minute(dt):
+        return int(dt.timestamp()) // 60 if dt else None
 
     def __get_recommendation_strategy(self, data):
         if data.get("strategy") == "mobilize_america":
@@ -161,22 +205,14 @@ class RecommendedEventRequestSerializer(serializers.Serializer):
         elif data.get("strategy") == "shifter_engine":
             return DBRecommendationStrategy
         else:
-            return MobilizeAmericaAPIRecommendationStrategy
+            return HybridRecommendationStrategy
 
     def __prepare_events(
         self, events, utm_source, timeslot_start=None, timeslot_end=None
     ):
-        events_with_open_timeslots = [remove_full_timeslots(e) for e in events]
-        events_with_extra_m_data = [
-            add_extras_for_mdata(e, utm_source) for e in events_with_open_timeslots
-        ]
-        events_with_filtered_timeslots = [
-            filter_timeslots_for_time(e, timeslot_start, timeslot_end)
-            for e in events_with_extra_m_data
-        ]
+        prepared_events = (
+            prepare_event_for_mdata(e, utm_source, timeslot_start, timeslot_end)
+            for e in events
+        )
         # Don't recommend events without timeslots for users to signup with
-        return [
-            sanitize_event_payload(e)
-            for e in events_with_filtered_timeslots
-            if len(e["timeslots"])
-        ]
+        return [e for e in prepared_events if e is not None]
@@ -0,0 +1,191 @@
+"""Asynchronous delivery of EventSignups to Mobilize America
+
+Syncing a signup to Mobilize America takes up to two MA calls (the attendance
+check and the POST), plus retries. With SHIFTER_SIGNUP_OUTBOX enabled, signups
+are only saved during the request, flagged ma_sync_deferred, and the
+EventSignup table doubles as an outbox: the drain_signup_outbox command sends
+the flagged signups in the background, and retry_ma_events resends failed ones
+the same way.
+
+Signups are sent in small batches, in order of event. Each event's attendances
+are fetched from Mobilize America once per batch, then the batch's signups are
+sent SHIFTER_SIGNUP_OUTBOX_CONCURRENCY at a time. At most
+SHIFTER_SIGNUP_OUTBOX_SENDS_PER_SECOND sends and prefetches are started a second;
+each usually makes one Mobilize America call, but can make more. Only the
+Mobilize America calls happen on worker threads: results are written back with
+one UPDATE as each batch finishes. Draining stops early while the Mobilize
+America circuit breaker is open, or once its time budget is spent.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from supportal.services.mobilize_america import (
+    MobilizeAmericaAPIException,
+    get_global_client,
+)
+from supportal.shifter.models import EventSignup
+
+DRAIN_LOCK_KEY = "shifter_signup_outbox_drain_lock"
+# No longer than the drain function's timeout in serverless.yml, so a drain
+# that gets killed doesn't hold up the next scheduled runs. Long drains (e.g.
+# retry_ma_events) refresh the lock after every batch.
+DRAIN_LOCK_TIMEOUT = 5 * 60
+
+
+class DrainInProgress(Exception):
+    """Another drain of the signup outbox holds the lock"""
+
+
+_RESULT_FIELDS = [
+    "ma_creation_successful",
+    "ma_response",
+    "signed_up_via_shifter",
+    "retried_at",
+    "ma_sync_deferred",
+    "updated_at",
+]
+
+
+class TokenBucket:
+    """Thread-safe limit of `rate` acquires a second, in bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.__rate = rate
+        self.__capacity = capacity or max(1, rate)
+        self.__tokens = self.__capacity
+        self.__updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        if not self.__rate:
+            return
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(
+                    self.__capacity,
+                    self.__tokens + (now - self.__updated_at) * self.__rate,
+                )
+                self.__updated_at = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.__rate
+            time.sleep(wait)
+
+
+def pending_signups():
+    """Signups saved in outbox mode that haven't been sent to Mobilize America"""
+    return (
+        EventSignup.objects.filter(
+            ma_sync_deferred=True,
+            ma_creation_successful=False,
+            retried_at__isnull=True,
+        )
+        .exclude(email="")
+        .exclude(zip5="")
+    )
+
+
+def _circuit_open(client):
+    return client.circuit_breaker is not None and client.circuit_breaker.is_open()
+
+
+def _prefetch_attendances(client, bucket, event_id):
+    if _circuit_open(client):
+        return
+    bucket.acquire()
+    try:
+        client.prefetch_event_attendances(event_id)
+    except MobilizeAmericaAPIException:
+        # The event's signups will fetch them, or fail, on their own
+        logging.exception(f"Failed to fetch attendances for event {event_id}")
+
+
+def _send(client, bucket, signup):
+    """Whether the signup was sent, None if it wasn't attempted"""
+    if _circuit_open(client):
+        return None
+    bucket.acquire()
+    success, _ = signup.send_to_mobilize_america()
+    return success
+
+
+def _send_batch(executor, client, bucket, signups):
+    """Send a batch of signups and save the results, returns (sent, failed)"""
+    event_ids = {
+        s.ma_event_id for s in signups if s.honor_ma_attendance and s.email and s.zip5
+    }
+    list(executor.map(partial(_prefetch_attendances, client, bucket), event_ids))
+    outcomes = list(executor.map(partial(_send, client, bucket), signups))
+
+    now = timezone.now()
+    attempted = []
+    for signup, outcome in zip(signups, outcomes):
+        if outcome is None:
+            continue
+        if outcome:
+            logging.info(f"Successfully sent signup with id {signup.id} to MA")
+        else:
+            logging.info(f"Still unable to send signup {signup.id} to MA")
+        signup.retried_at = now
+        signup.ma_sync_deferred = False
+        signup.updated_at = now
+        attempted.append(signup)
+    EventSignup.objects.bulk_update(attempted, _RESULT_FIELDS)
+    sent = sum(1 for outcome in outcomes if outcome)
+    return sent, len(attempted) - sent
+
+
+def drain_signup_outbox(signups=None, limit=None, batch_size=20, time_budget=None):
+    """Send signups to Mobilize America, returns (sent, failed) counts
+
+    Sends pending_signups() unless given another EventSignup queryset. Every
+    signup that is attempted gets its retried_at set. No new batch is started
+    after `time_budget` seconds. Raises DrainInProgress if another drain is
+    already sending signups.
+    """
+    if not cache.add(DRAIN_LOCK_KEY, True, DRAIN_LOCK_TIMEOUT):
+        raise DrainInProgress()
+
+    if signups is None:
+        signups = pending_signups()
+    ids = signups.order_by("ma_event_id", "created_at").values_list("id", flat=True)
+    if limit:
+        ids = ids[:limit]
+    ids = list(ids)
+
+    deadline = time.monotonic() + time_budget if time_budget else None
+    client = get_global_client()
+    bucket = TokenBucket(settings.SHIFTER_SIGNUP_OUTBOX_SENDS_PER_SECOND)
+    sent, failed = 0, 0
+    try:
+        with ThreadPoolExecutor(
+            max_workers=settings.SHIFTER_SIGNUP_OUTBOX_CONCURRENCY
+        ) as executor:
+            for start in range(0, len(ids), batch_size):
+                if deadline is not None and time.monotonic() >= deadline:
+                    logging.info("Out of time, leaving the rest of the outbox")
+                    break
+                batch = list(
+                    EventSignup.objects.filter(
+                        id__in=ids[start : start + batch_size]
+                    ).order_by("ma_event_id", "created_at")
+                )
+                batch_sent, batch_failed = _send_batch(executor, client, bucket, batch)
+                sent += batch_sent
+                failed += batch_failed
+                if batch_sent + batch_failed < len(batch):
+                    logging.warning("Mobilize America is unavailable, stopping drain")
+                    break
+                cache.set(DRAIN_LOCK_KEY, True, DRAIN_LOCK_TIMEOUT)
+    finally:
+        cache.delete(DRAIN_LOCK_KEY)
+    return sent, failed
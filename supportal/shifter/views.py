@@ -1,12 +1,16 @@
+import hashlib
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.measure import D
+from django.core.cache import cache
 from django.db.models import Min
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import permissions, status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import (
     CreateAPIView,
     GenericAPIView,
@@ -24,19 +28,19 @@ from supportal.services.mobilize_america import (
     get_global_client,
 )
 from supportal.shifter import mobilize_america_helpers
+from supportal.shifter.caching import event_detail_cache_key
 from supportal.shifter.common.error_codes import (
     ErrorCodes,
     generate_error_for_code,
     get_error_code_and_status,
 )
-from supportal.shifter.models import MobilizeAmericaEvent, USZip5
+from supportal.shifter.models import EARLY_STATES, MobilizeAmericaEvent, USZip5
 from supportal.shifter.serializers import (
     EventSignupSerializer,
     RecommendedEventRequestSerializer,
     USZip5Serializer,
 )
-
-EARLY_STATES = ["IA", "NH", "NV", "SC"]
+from supportal.shifter.zip5_table import lookup_zip5
 
 
 class ShifterWrappedExceptionView(GenericAPIView):
@@ -107,20 +111,151 @@ class MobilizeAmericaEventView(RetrieveAPIView, ShifterViewMixin):
                 ),
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        event = MobilizeAmericaEvent.objects.filter(id=event_id, is_active=True)
-        if event.exists():
-            res = event.first().raw
-        else:
-            try:
+
+        cache_key = event_detail_cache_key(event_id)
+        cached = cache.get(cache_key)
+        if cached is None:
+            res = (
+                MobilizeAmericaEvent.objects.filter(id=event_id, is_active=True)
+                .values_list("raw", flat=True)
+                .first()
+            )
+            if res is None:
                 # get the response from mobilize america if it's not in our DB
-                res = get_global_client().get_organization_event(event_id)["data"]
-            except MobilizeAmericaAPIException as e:
-                error_response, status_code = get_error_code_and_status(e.response)
-                return Response(error_response, status=status_code)
+                cached = _event_entry_from_ma(_fetch_event_from_ma(event_id))
+            else:
+                cached = _event_entry(res)
+            _cache_event_entry(cache_key, cached)
+
+        if cached["status"] != status.HTTP_200_OK:
+            return Response(cached["data"], status=cached["status"])
+
+        max_age = settings.SHIFTER_EVENT_DETAIL_CACHE_TIMEOUT
+        headers = {
+            "ETag": cached["etag"],
+            "Cache-Control": f"public, max-age={max_age}",
+        }
+        if _etag_matches(cached["etag"], request.META.get("HTTP_IF_NONE_MATCH")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(cached["data"], status=status.HTTP_200_OK, headers=headers)
+
+
+class MobilizeAmericaEventBatchView(ShifterViewMixin, APIView):
+    def get(self, request, **kwargs):
+        """Returns sanitized events keyed by id, along with per-id errors"""
+        params = get_query_parameter_dict(request, {"ids"})
+        try:
+            event_ids = list(dict.fromkeys(int(i) for i in params.get("ids", [])))
+        except ValueError:
+            event_ids = []
+        if not event_ids or len(event_ids) > settings.SHIFTER_EVENT_BATCH_MAX_IDS:
+            return Response(
+                generate_error_for_code(
+                    ErrorCodes.INVALID_EVENT_ID.name,
+                    {
+                        "detail": "ids must be a list of at most "
+                        f"{settings.SHIFTER_EVENT_BATCH_MAX_IDS} event ids"
+                    },
+                ),
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cache_keys = {
+            event_id: event_detail_cache_key(event_id) for event_id in event_ids
+        }
+        cached = cache.get_many(cache_keys.values())
+        entries = {
+            event_id: cached[key]
+            for event_id, key in cache_keys.items()
+            if key in cached
+        }
+
+        missing = [event_id for event_id in event_ids if event_id not in entries]
+        if missing:
+            for event_id, raw in MobilizeAmericaEvent.objects.filter(
+                id__in=missing, is_active=True
+            ).values_list("id", "raw"):
+                entries[event_id] = _event_entry(raw)
+            self.__add_entries_from_ma(
+                [event_id for event_id in missing if event_id not in entries], entries
+            )
+            for event_id in missing:
+                _cache_event_entry(cache_keys[event_id], entries[event_id])
+
+        data = {}
+        errors = {}
+        for event_id in event_ids:
+            entry = entries[event_id]
+            if entry["status"] == status.HTTP_200_OK:
+                data[str(event_id)] = entry["data"]
+            else:
+                errors[str(event_id)] = {
+                    **entry["data"],
+                    "status_code": entry["status"],
+                }
+        return Response({"count": len(data), "data": data, "errors": errors}, 200)
+
+    def __add_entries_from_ma(self, event_ids, entries):
+        """Fetch events from Mobilize America concurrently
+
+        Only the HTTP requests run in the pool, sanitizing can hit the database
+        so it stays on this thread.
+        """
+        if not event_ids:
+            return
+        max_workers = min(len(event_ids), settings.SHIFTER_EVENT_BATCH_MA_CONCURRENCY)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(_fetch_event_from_ma, event_ids)
+            for event_id, result in zip(event_ids, results):
+                entries[event_id] = _event_entry_from_ma(result)
+
+
+def _event_entry(raw):
+    """The cacheable response for an event we have the raw payload for"""
+    # The frontend is responsible for removing the full timeslots for switchboard/embedded shifter
+    sanitized_res = mobilize_america_helpers.sanitize_event_payload(raw)
+    etag = hashlib.sha1(
+        json.dumps(sanitized_res, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return {
+        "status": status.HTTP_200_OK,
+        "data": sanitized_res,
+        "etag": quote_etag(etag),
+    }
+
+
+def _fetch_event_from_ma(event_id):
+    """The Mobilize America response, or the MobilizeAmericaAPIException raised"""
+    try:
+        return get_global_client().get_organization_event(event_id)
+    except MobilizeAmericaAPIException as e:
+        return e
+
+
+def _event_entry_from_ma(ma_result):
+    if isinstance(ma_result, MobilizeAmericaAPIException):
+        error_response, status_code = get_error_code_and_status(ma_result.response)
+        return {"status": status_code, "data": error_response}
+    return _event_entry(ma_result["data"])
+
+
+def _cache_event_entry(cache_key, entry):
+    if entry["status"] == status.HTTP_200_OK:
+        cache.set(cache_key, entry, settings.SHIFTER_EVENT_DETAIL_CACHE_TIMEOUT)
+    elif entry["status"] == status.HTTP_404_NOT_FOUND:
+        cache.set(
+            cache_key, entry, settings.SHIFTER_EVENT_DETAIL_NOT_FOUND_CACHE_TIMEOUT
+        )
 
-        # The frontend is responsible for removing the full timeslots for switchboard/embedded shifter
-        sanitized_res = mobilize_america_helpers.sanitize_event_payload(res)
-        return Response(sanitized_res, status=status.HTTP_200_OK)
+
+def _etag_matches(etag, if_none_match):
+    """Weak comparison of an ETag against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    if "*" in etags:
+        return True
+    return etag in [e[2:] if e.startswith("W/") else e for e in etags]
 
 
 class USZip5View(RetrieveAPIView, ShifterWrappedExceptionView):
@@ -129,23 +264,57 @@ class USZip5View(RetrieveAPIView, ShifterWrappedExceptionView):
     lookup_field = "zip5"
     queryset = USZip5.objects.all()
 
+    def get_object(self):
+        try:
+            return lookup_zip5(self.kwargs[self.lookup_field])
+        except USZip5.DoesNotExist:
+            raise NotFound()
+
 
 class EarlyStateView(ListAPIView, ShifterViewMixin):
     def get(self, request, **kwargs):
         zip5 = request.query_params.get("zip5")
         if not zip5 or len(zip5) != 5:
             raise ValidationError("zip5 is required")
-        try:
-            coordinates = USZip5.objects.get(zip5=zip5).coordinates
-        except USZip5.DoesNotExist:
+        zip_values = (
+            USZip5.objects.filter(zip5=zip5)
+            .values("coordinates", "early_state_distances")
+            .first()
+        )
+        if zip_values is None:
             raise ValidationError(f"zip5 {zip5} not found!")
 
-        fargs = {"state__in": EARLY_STATES}
         max_dist = request.query_params.get("max_dist")
+        early_state_distances = zip_values["early_state_distances"]
+        if early_state_distances is not None:
+            states = sorted(
+                (
+                    {"state": state, "distance": D(m=meters)}
+                    for state, meters in early_state_distances.items()
+                    if not max_dist or meters <= D(mi=int(max_dist)).m
+                ),
+                key=lambda s: s["distance"],
+            )
+        else:
+            # Not precomputed yet (see USZip5.update_early_state_distances)
+            states = self.__query_early_state_distances(
+                zip_values["coordinates"], max_dist
+            )
+        res = {
+            "count": len(states),
+            "data": [
+                {"state": s["state"], "min_distance": int(s["distance"].mi)}
+                for s in states
+            ],
+        }
+        return Response(res, 200)
+
+    def __query_early_state_distances(self, coordinates, max_dist):
+        fargs = {"state__in": EARLY_STATES}
         if max_dist:
             fargs["coordinates__distance_lte"] = (coordinates, D(mi=int(max_dist)))
 
-        states = list(
+        return list(
             USZip5.objects.filter(**fargs)
             .values("state")
             # Using MIN here is kind of arbitrary, but it should work better than
@@ -155,14 +324,6 @@ class EarlyStateView(ListAPIView, ShifterViewMixin):
             .annotate(distance=Min(Distance("coordinates", coordinates)))
             .order_by("distance")
         )
-        res = {
-            "count": len(states),
-            "data": [
-                {"state": s["state"], "min_distance": int(s["distance"].mi)}
-                for s in states
-            ],
-        }
-        return Response(res, 200)
 
 
 class RecommendedEventView(ShifterViewMixin, APIView):
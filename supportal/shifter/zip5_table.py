@@ -0,0 +1,194 @@
+"""Array-backed lookup table for USZip5 data
+
+The public shifter API resolves a zip5 on almost every request. The zip table
+is static, so instead of asking the database every time we build a compact
+binary file from it (see the build_zip5_table command) and mmap that file.
+
+Layout, in native byte order:
+
+    header   magic, row count, strings length, index size, reserved
+    index    int32[100000], zip5 as an int -> row number or -1
+    latitude float64[rows], NaN when unknown
+    longitude float64[rows], NaN when unknown
+    city     uint32[rows], index into the "cities" string list
+    state    uint8[rows], index into the "states" string list
+    strings  utf-8 JSON {"states": [...], "cities": [...]}
+
+If no table is configured, or a zip5 isn't in it, lookups fall back to the
+USZip5 model.
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+from array import array
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+
+from supportal.shifter.models import USZip5
+
+MAGIC = b"ZIP5TBL1"
+INDEX_SIZE = 100000
+_HEADER = struct.Struct("=8sIIII")
+
+
+class Zip5Record(NamedTuple):
+    zip5: str
+    city: str
+    state: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return Point(self.longitude, self.latitude, srid=4326)
+
+    @classmethod
+    def from_model(cls, zip_obj):
+        coordinates = zip_obj.coordinates
+        return cls(
+            zip5=zip_obj.zip5,
+            city=zip_obj.city,
+            state=zip_obj.state,
+            latitude=coordinates.y if coordinates else None,
+            longitude=coordinates.x if coordinates else None,
+        )
+
+
+def _zip5_to_int(zip5):
+    zip5 = str(zip5)
+    if len(zip5) != 5 or not zip5.isdigit():
+        return None
+    return int(zip5)
+
+
+class Zip5Table:
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        magic, rows, strings_length, index_size, _ = _HEADER.unpack_from(view)
+        if magic != MAGIC or index_size != INDEX_SIZE:
+            raise ValueError("Not a zip5 table")
+        offset = _HEADER.size
+
+        def section(item_size, count, fmt):
+            nonlocal offset
+            start = offset
+            offset += item_size * count
+            return view[start:offset].cast(fmt)
+
+        self._index = section(4, INDEX_SIZE, "i")
+        self._latitude = section(8, rows, "d")
+        self._longitude = section(8, rows, "d")
+        self._city = section(4, rows, "I")
+        self._state = section(1, rows, "B")
+        strings = json.loads(bytes(view[offset : offset + strings_length]))
+        self._cities = strings["cities"]
+        self._states = strings["states"]
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def get(self, zip5) -> Optional[Zip5Record]:
+        zip_int = _zip5_to_int(zip5)
+        if zip_int is None:
+            return None
+        row = self._index[zip_int]
+        if row < 0:
+            return None
+        latitude = self._latitude[row]
+        longitude = self._longitude[row]
+        return Zip5Record(
+            zip5=f"{zip_int:05d}",
+            city=self._cities[self._city[row]],
+            state=self._states[self._state[row]],
+            latitude=None if math.isnan(latitude) else latitude,
+            longitude=None if math.isnan(longitude) else longitude,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def build_zip5_table(records):
+    """Serialize an iterable of Zip5Records into the table's binary format"""
+    index = array("i", [-1]) * INDEX_SIZE
+    latitude = array("d")
+    longitude = array("d")
+    city = array("I")
+    state = array("B")
+    cities = {}
+    states = {}
+    for record in records:
+        zip_int = _zip5_to_int(record.zip5)
+        if zip_int is None:
+            raise ValueError(f"Invalid zip5 {record.zip5!r}")
+        index[zip_int] = len(latitude)
+        latitude.append(record.latitude if record.latitude is not None else math.nan)
+        longitude.append(record.longitude if record.longitude is not None else math.nan)
+        city.append(cities.setdefault(record.city, len(cities)))
+        state.append(states.setdefault(record.state, len(states)))
+
+    strings = json.dumps({"cities": list(cities), "states": list(states)}).encode(
+        "utf-8"
+    )
+    header = _HEADER.pack(MAGIC, len(latitude), len(strings), INDEX_SIZE, 0)
+    return b"".join(
+        [
+            header,
+            index.tobytes(),
+            latitude.tobytes(),
+            longitude.tobytes(),
+            city.tobytes(),
+            state.tobytes(),
+            strings,
+        ]
+    )
+
+
+def write_zip5_table(path, records):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(build_zip5_table(records))
+    os.replace(tmp_path, path)
+
+
+_loaded_table = {"loaded": False, "table": None}
+
+
+def get_zip5_table() -> Optional[Zip5Table]:
+    """The table at settings.SHIFTER_ZIP5_TABLE_PATH, loaded once per process"""
+    if not _loaded_table["loaded"]:
+        path = settings.SHIFTER_ZIP5_TABLE_PATH
+        table = None
+        if path:
+            try:
+                table = Zip5Table.load(path)
+            except (OSError, ValueError):
+                logging.exception(f"Failed to load zip5 table from {path}")
+        _loaded_table["table"] = table
+        _loaded_table["loaded"] = True
+    return _loaded_table["table"]
+
+
+def reset_zip5_table():
+    _loaded_table["loaded"] = False
+    _loaded_table["table"] = None
+
+
+def lookup_zip5(zip5) -> Zip5Record:
+    """Resolve a zip5, raises USZip5.DoesNotExist if we don't know it"""
+    table = get_zip5_table()
+    if table is not None:
+        record = table.get(zip5)
+        if record is not None:
+            return record
+    return Zip5Record.from_model(USZip5.objects.get(zip5=zip5))
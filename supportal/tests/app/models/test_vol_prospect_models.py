@@ -386,6 +386,7 @@ def test_add_successful_contact_ma_signup(cambridge_prospect_assignment):
         zip5=person.zip5,
         phone=person.phone,
         source="switchboard",
+        ma_sync_deferred=False,
     )
     event_sign_up_mock.objects.create.return_value.sync_to_mobilize_america.assert_called_once_with()
 
@@ -418,11 +419,43 @@ def test_add_successful_contact_ma_signup_fails(cambridge_prospect_assignment):
         zip5=person.zip5,
         phone=person.phone,
         source="switchboard",
+        ma_sync_deferred=False,
     )
     event_sign_up_mock.objects.create.return_value.sync_to_mobilize_america.assert_called_once_with()
     assert cambridge_prospect_assignment.vol_prospect_contact_events.count() == 0
 
 
+@pytest.mark.django_db
+def test_add_successful_contact_ma_signup_outbox(
+    cambridge_prospect_assignment, settings
+):
+    settings.SHIFTER_SIGNUP_OUTBOX = True
+    with unittest.mock.patch(
+        "supportal.app.models.vol_prospect_models.EventSignup"
+    ) as event_sign_up_mock:
+        cambridge_prospect_assignment.create_contact_event(
+            result_category=CanvassResultCategory.SUCCESSFUL,
+            result=CanvassResult.SUCCESSFUL_CANVASSED,
+            ma_event_id=123456,
+            ma_timeslot_ids=[1],
+        )
+    person = cambridge_prospect_assignment.person
+    event_sign_up_mock.objects.create.assert_called_once_with(
+        email=person.email,
+        family_name=person.last_name,
+        given_name=person.first_name,
+        ma_event_id=123456,
+        ma_timeslot_ids=[1],
+        zip5=person.zip5,
+        phone=person.phone,
+        source="switchboard",
+        ma_sync_deferred=True,
+    )
+    # drain_signup_outbox sends it instead
+    event_sign_up_mock.objects.create.return_value.sync_to_mobilize_america.assert_not_called()
+    assert cambridge_prospect_assignment.vol_prospect_contact_events.count() == 1
+
+
 @pytest.mark.django_db
 def test_add_successful_contact_ma_signup_no_email(cambridge_prospect_assignment):
     """Adding a SUCCESSFUL contact event marks the VolProspectAssignment as CONTACTED_SUCCESSFUL."""
@@ -0,0 +1,97 @@
+import pytest
+
+from supportal.services.fake_mobilize_america import (
+    FakeMobilizeAmericaServer,
+    FaultConfig,
+    generate_events,
+)
+from supportal.services.mobilize_america import (
+    AttendanceRequestPerson,
+    MobilizeAmericaAPIException,
+    MobilizeAmericaClient,
+)
+
+
+@pytest.fixture
+def fake_ma():
+    server = FakeMobilizeAmericaServer(
+        ("127.0.0.1", 0), generate_events(60), page_size=10
+    )
+    server.serve_in_thread()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, **kwargs):
+    return MobilizeAmericaClient(1, "PUBLIC", server.url, "key", **kwargs)
+
+
+def test_generate_events_is_repeatable():
+    assert generate_events(5, seed=3) == generate_events(5, seed=3)
+    assert generate_events(5, seed=3) != generate_events(5, seed=4)
+
+
+def test_list_and_get_events(fake_ma):
+    client = _client(fake_ma)
+    public_ids = {
+        e["id"] for e in fake_ma.events.values() if e["visibility"] == "PUBLIC"
+    }
+    pages = list(client.list_organization_events())
+    assert len(pages) == -(-len(public_ids) // 10)
+    assert {e["id"] for page in pages for e in page["data"]} == public_ids
+
+    first_page = client.get_organization_events_page()
+    assert len(MobilizeAmericaClient.remaining_page_urls(first_page)) == len(pages) - 1
+
+    event_id = next(iter(public_ids))
+    assert client.get_organization_event(event_id)["data"]["id"] == event_id
+    with pytest.raises(MobilizeAmericaAPIException) as exc_info:
+        client.get_organization_event(10000)
+    assert exc_info.value.status_code == 404
+
+
+def test_create_event_attendance(fake_ma):
+    client = _client(fake_ma)
+    event = next(
+        e
+        for e in fake_ma.events.values()
+        if not any(t["is_full"] for t in e["timeslots"])
+    )
+    timeslot_ids = [t["id"] for t in event["timeslots"]]
+    person = AttendanceRequestPerson(
+        given_name="Matteo",
+        family_name="B",
+        email_address="mbanerjee@elizabethwarren.com",
+        postal_code="11238",
+    )
+    res, signed_up = client.create_event_attendance(event["id"], timeslot_ids, person)
+    assert signed_up == timeslot_ids
+    assert len(res["data"]) == len(timeslot_ids)
+
+    attendances, remaining = client.check_for_event_attendance(
+        event["id"], timeslot_ids, person.email_address
+    )
+    assert len(attendances) == len(timeslot_ids)
+    assert remaining == []
+
+    with pytest.raises(MobilizeAmericaAPIException) as exc_info:
+        client.create_event_attendance(event["id"], [-1], person)
+    assert exc_info.value.response["error"]["timeslots"] == [
+        "Timeslot is not associated with event."
+    ]
+
+
+def test_injected_faults(fake_ma):
+    client = _client(fake_ma, retries=0, retry_statuses=())
+    fake_ma.faults = FaultConfig(error_rate=1)
+    with pytest.raises(MobilizeAmericaAPIException) as exc_info:
+        client.get_organization_event(1)
+    assert exc_info.value.status_code == 500
+
+    fake_ma.faults = FaultConfig(
+        rate_limit_every_seconds=60, rate_limit_burst_seconds=60
+    )
+    with pytest.raises(MobilizeAmericaAPIException) as exc_info:
+        client.get_organization_event(1)
+    assert exc_info.value.status_code == 429
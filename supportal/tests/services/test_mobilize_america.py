@@ -1,5 +1,10 @@
 import json
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
+import freezegun
 import pytest
 import responses
 from requests.exceptions import ConnectionError
@@ -8,6 +13,7 @@ from supportal import settings
 from supportal.services import mobilize_america
 from supportal.services.mobilize_america import (
     AttendanceRequestPerson,
+    CircuitBreaker,
     MobilizeAmericaAPIException,
     MobilizeAmericaClient,
 )
@@ -45,6 +51,30 @@ def test_list_events():
     assert len(responses.calls) == 2
 
 
+def test_remaining_page_urls():
+    url = "https://localhost:8000/mobilize/v1/organizations/1/events"
+    first_page = {
+        "count": 7,
+        "next": f"{url}?page=2&visibility=PUBLIC",
+        "data": [{"id": 1}, {"id": 2}, {"id": 3}],
+    }
+    assert MobilizeAmericaClient.remaining_page_urls(first_page) == [
+        f"{url}?page=2&visibility=PUBLIC",
+        f"{url}?page=3&visibility=PUBLIC",
+    ]
+    assert MobilizeAmericaClient.remaining_page_urls({**first_page, "next": None}) == []
+    # fall back to following next links if we can't tell how many pages there are
+    assert (
+        MobilizeAmericaClient.remaining_page_urls({**first_page, "count": None}) is None
+    )
+    assert (
+        MobilizeAmericaClient.remaining_page_urls(
+            {**first_page, "next": f"{url}?cursor=abc"}
+        )
+        is None
+    )
+
+
 @responses.activate
 def test_connection_error_retry():
     n = 0
@@ -132,6 +162,55 @@ def test_create_event_attendance_already_exists():
     assert len(responses.calls) == 1
 
 
+@responses.activate
+def test_create_event_attendance_caches_attendances():
+    url = "https://localhost:8000/mobilize/v1/organizations/1/events/17/attendances"
+    responses.add(
+        responses.GET,
+        url,
+        body=json.dumps({"data": [], "next": f"{url}?page=2"}),
+        match_querystring=True,
+    )
+    responses.add(
+        responses.GET,
+        f"{url}?page=2",
+        body=json.dumps({"data": []}),
+        match_querystring=True,
+    )
+    responses.add(responses.POST, url, body=json.dumps(CREATE_ATTENDANCE_RESPONSE))
+
+    def person(email):
+        return AttendanceRequestPerson(
+            given_name="Matteo",
+            family_name="B",
+            email_address=email,
+            postal_code="11238",
+        )
+
+    mobilize_america.get_global_client().create_event_attendance(
+        17, timeslot_ids=[40896, 40894], person=person("mbanerjee@elizabethwarren.com")
+    )
+    assert len(responses.calls) == 3
+
+    # The cache is shared between clients and updated with the new attendances
+    client = MobilizeAmericaClient(
+        1, "PUBLIC", "https://localhost:8000/mobilize/v1", "k"
+    )
+    res, timeslots = client.create_event_attendance(
+        17, timeslot_ids=[40896, 40894], person=person("MBanerjee@elizabethwarren.com")
+    )
+    assert timeslots == []
+    assert len(res["data"]) == 2
+    assert len(responses.calls) == 3
+
+    # Other people's signups don't need to fetch the attendances again
+    client.create_event_attendance(
+        17, timeslot_ids=[40896], person=person("someone@elizabethwarren.com")
+    )
+    assert len(responses.calls) == 4
+    assert responses.calls[3].request.method == "POST"
+
+
 @responses.activate
 def test_error_mapping():
     responses.add(
@@ -143,3 +222,98 @@ def test_error_mapping():
     with pytest.raises(MobilizeAmericaAPIException) as exec_info:
         mobilize_america.get_global_client().list_organization_events()
     assert exec_info.value.response["error"]["detail"] == "Not found."
+
+
+@responses.activate
+def test_circuit_breaker():
+    url = "https://localhost:8000/mobilize/v1/organizations/1/events/17"
+    breaker = CircuitBreaker(
+        "test_circuit_breaker", failure_threshold=2, reset_timeout=30
+    )
+    breaker.reset()
+    client = MobilizeAmericaClient(
+        1,
+        "PUBLIC",
+        settings.MOBILIZE_AMERICA_BASE_URL,
+        settings.MOBILIZE_AMERICA_API_KEY,
+        retry_statuses=(),
+        circuit_breaker=breaker,
+    )
+    # responses serves these in order, repeating the last one
+    responses.add(responses.GET, url, body="{}", status=502)
+    responses.add(responses.GET, url, body="{}", status=502)
+    responses.add(responses.GET, url, body=json.dumps({"data": {"id": 17}}))
+    now = datetime.now()
+    with freezegun.freeze_time(now):
+        for _ in range(2):
+            with pytest.raises(MobilizeAmericaAPIException) as exc_info:
+                client.get_organization_event(17)
+            assert exc_info.value.status_code == 502
+        assert len(responses.calls) == 2
+
+        # open: fail fast without calling MA
+        with pytest.raises(MobilizeAmericaAPIException) as exc_info:
+            client.get_organization_event(17)
+        assert exc_info.value.status_code == 503
+        assert len(responses.calls) == 2
+
+    with freezegun.freeze_time(now + timedelta(seconds=31)):
+        # half-open: one call gets through and closes the breaker
+        assert client.get_organization_event(17)["data"]["id"] == 17
+        assert breaker.allow_request()
+        assert client.get_organization_event(17)["data"]["id"] == 17
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_concurrent_identical_gets_are_coalesced():
+    def slow_event(request):
+        time.sleep(0.5)
+        return 200, {}, json.dumps({"data": {"id": 17}})
+
+    responses.add_callback(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events/17",
+        callback=slow_event,
+    )
+    # two clients stand in for two instances, which share calls through the cache
+    clients = [
+        MobilizeAmericaClient(
+            1,
+            "PUBLIC",
+            settings.MOBILIZE_AMERICA_BASE_URL,
+            settings.MOBILIZE_AMERICA_API_KEY,
+        )
+        for _ in range(2)
+    ]
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(
+            executor.map(lambda i: clients[i % 2].get_organization_event(17), range(6))
+        )
+    assert len(responses.calls) == 1
+    assert all(r == {"data": {"id": 17}} for r in results)
+    # callers get their own copies
+    assert len({id(r) for r in results}) == 6
+
+    # calls that aren't concurrent aren't coalesced
+    clients[0].get_organization_event(17)
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_single_flight_get_only_copies_for_waiters():
+    responses.add(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events/17",
+        body=json.dumps({"data": {"id": 17}}),
+    )
+    client = MobilizeAmericaClient(
+        1,
+        "PUBLIC",
+        settings.MOBILIZE_AMERICA_BASE_URL,
+        settings.MOBILIZE_AMERICA_API_KEY,
+    )
+    with unittest.mock.patch(
+        "supportal.services.mobilize_america.deepcopy", side_effect=AssertionError
+    ):
+        assert client.get_organization_event(17) == {"data": {"id": 17}}
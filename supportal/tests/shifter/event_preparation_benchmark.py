@@ -0,0 +1,199 @@
+"""Benchmark prepare_event_for_mdata against the pipeline it replaced
+
+The legacy multi-pass pipeline lives here as the reference implementation for
+tests. Run the benchmark with:
+
+    python -m supportal.tests.shifter.event_preparation_benchmark [--from_db]
+"""
+import argparse
+import os
+import random
+import timeit
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+
+import django
+import pytz
+
+from supportal.services.mobilize_america import PUBLIC_VISIBILITY
+from supportal.shifter import mobilize_america_helpers as helpers
+
+UTM_SOURCE = "SMS"
+
+# The module's private formatters, which both pipelines share
+_timestamp_to_datetime_in_zone = getattr(helpers, "__timestamp_to_datetime_in_zone")
+_format_times_synopsis = getattr(helpers, "__format_times_synopsis")
+_format_event_start_date_and_time = getattr(
+    helpers, "__format_event_start_date_and_time"
+)
+_add_utm_source = getattr(helpers, "__add_utm_source")
+
+
+def _remove_full_timeslots(event):
+    event_dupe = deepcopy(event)
+    event_dupe["timeslots"] = [t for t in event_dupe["timeslots"] if not t["is_full"]]
+    return event_dupe
+
+
+def _add_extras_for_mdata(event, utm_source):
+    tz = pytz.timezone(event["timezone"])
+    for timeslot in event["timeslots"]:
+        local_timestamp = _timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
+        timeslot["formatted_time"] = _format_event_start_date_and_time(local_timestamp)
+        timeslot["local_start_time"] = local_timestamp.strftime("%Y-%m-%dT%H:%M:%S")
+    event["times_synopsis"] = _format_times_synopsis(
+        [
+            _timestamp_to_datetime_in_zone(t["start_date"], tz)
+            for t in event["timeslots"]
+        ]
+    )
+    event["browser_url"] = _add_utm_source(event["browser_url"], utm_source)
+    return event
+
+
+def _filter_timeslots_for_time(
+    event, timeslot_start_after_utc, timeslot_end_before_utc
+):
+    event_dupe = deepcopy(event)
+    tz = pytz.timezone(event["timezone"])
+
+    timeslots_within_range = []
+    for timeslot in event_dupe["timeslots"]:
+        timeslot_start = _timestamp_to_datetime_in_zone(timeslot["start_date"], tz)
+        timeslot_end = _timestamp_to_datetime_in_zone(timeslot["end_date"], tz)
+        is_valid_timeslot = True
+
+        if timeslot_start_after_utc:
+            is_valid_timeslot = timeslot_start > timeslot_start_after_utc
+        if timeslot_end_before_utc:
+            is_valid_timeslot = is_valid_timeslot and (
+                timeslot_end < timeslot_end_before_utc
+            )
+
+        if is_valid_timeslot:
+            timeslots_within_range.append(timeslot)
+
+    event_dupe["timeslots"] = timeslots_within_range
+    return event_dupe
+
+
+def legacy_prepare_events(events, utm_source, timeslot_start, timeslot_end):
+    """The multi-pass pipeline prepare_event_for_mdata replaced"""
+    events_with_open_timeslots = [_remove_full_timeslots(e) for e in events]
+    events_with_extra_m_data = [
+        _add_extras_for_mdata(e, utm_source) for e in events_with_open_timeslots
+    ]
+    events_with_filtered_timeslots = [
+        _filter_timeslots_for_time(e, timeslot_start, timeslot_end)
+        for e in events_with_extra_m_data
+    ]
+    return [
+        helpers.sanitize_event_payload(e)
+        for e in events_with_filtered_timeslots
+        if len(e["timeslots"])
+    ]
+
+
+def single_pass_prepare_events(events, utm_source, timeslot_start, timeslot_end):
+    prepared_events = (
+        helpers.prepare_event_for_mdata(e, utm_source, timeslot_start, timeslot_end)
+        for e in events
+    )
+    return [e for e in prepared_events if e is not None]
+
+
+def synthetic_events(count, timeslots_per_event, seed=0):
+    """Mobilize America-shaped events with a mix of full and multi-day timeslots"""
+    rnd = random.Random(seed)
+    start = int(datetime.now(tz=timezone.utc).timestamp())
+    events = []
+    for event_id in range(count):
+        timeslot_start = start + rnd.randint(0, 86400 * 7)
+        timeslots = []
+        for timeslot_id in range(timeslots_per_event):
+            timeslot_start += rnd.choice([3600, 3 * 3600, 86400])
+            timeslots.append(
+                {
+                    "id": event_id * timeslots_per_event + timeslot_id,
+                    "start_date": timeslot_start,
+                    "end_date": timeslot_start + 2 * 3600,
+                    "is_full": rnd.random() < 0.2,
+                }
+            )
+        events.append(
+            {
+                "id": event_id,
+                "title": f"Synthetic event {event_id}",
+                "event_type": "CANVASS",
+                "browser_url": f"https://events.elizabethwarren.com/event/{event_id}/",
+                "description": "A synthetic event",
+                "high_priority": False,
+                "timezone": rnd.choice(
+                    ["America/Chicago", "America/New_York", "America/Los_Angeles"]
+                ),
+                "address_visibility": PUBLIC_VISIBILITY,
+                "location": {"postal_code": "52240", "region": "IA"},
+                "contact": {"email_address": "private@example.com"},
+                "tags": [],
+                "timeslots": timeslots,
+            }
+        )
+    return events
+
+
+def run_benchmark(events, iterations):
+    """Check both pipelines agree on events, then time them"""
+    now = datetime.now(tz=timezone.utc)
+    windows = [(None, None), (now + timedelta(days=1), now + timedelta(days=5))]
+    for timeslot_start, timeslot_end in windows:
+        args = (events, UTM_SOURCE, timeslot_start, timeslot_end)
+        if legacy_prepare_events(*args) != single_pass_prepare_events(*args):
+            raise ValueError(
+                f"Output differs for window {timeslot_start} - {timeslot_end}"
+            )
+
+    args = (events, UTM_SOURCE, None, None)
+    legacy = timeit.timeit(lambda: legacy_prepare_events(*args), number=iterations)
+    single_pass = timeit.timeit(
+        lambda: single_pass_prepare_events(*args), number=iterations
+    )
+    return (
+        f"Identical output for {len(events)} events. "
+        f"legacy: {legacy / iterations * 1000:.2f}ms/response, "
+        f"single pass: {single_pass / iterations * 1000:.2f}ms/response"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--events", type=int, default=20, help="Number of events per response"
+    )
+    parser.add_argument(
+        "--timeslots", type=int, default=40, help="Timeslots per synthetic event"
+    )
+    parser.add_argument("--iterations", type=int, default=50, help="Responses to time")
+    parser.add_argument(
+        "--from_db", action="store_true", help="Use imported events instead"
+    )
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "supportal.settings")
+    django.setup()
+    if options.from_db:
+        from supportal.shifter.models import MobilizeAmericaEvent
+
+        events = list(
+            MobilizeAmericaEvent.objects.filter(is_active=True).values_list(
+                "raw", flat=True
+            )[: options.events]
+        )
+    else:
+        events = synthetic_events(options.events, options.timeslots)
+    if not events:
+        parser.error("No events to benchmark")
+    print(run_benchmark(events, options.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from supportal.shifter.management.commands.build_zip5_table import Command
+from supportal.shifter.models import USZip5
+from supportal.shifter.zip5_table import (
+    Zip5Table,
+    get_zip5_table,
+    lookup_zip5,
+    reset_zip5_table,
+)
+
+TEST_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "us_10_test_zip5s.csv.gz"
+)
+
+
+@pytest.fixture
+def zip5_table_path(settings, tmp_path):
+    path = str(tmp_path / "zip5_table.bin")
+    settings.SHIFTER_ZIP5_TABLE_PATH = path
+    yield path
+    reset_zip5_table()
+
+
+@pytest.mark.django_db
+def test_handle_from_csv(zip5_table_path):
+    assert Command().handle(file=TEST_FILE_PATH) == (
+        f"Wrote 10 zips to {zip5_table_path}"
+    )
+    table = Zip5Table.load(zip5_table_path)
+    record = table.get("00544")
+    assert record.city == "Holtsville"
+    assert record.state == "NY"
+    assert record.latitude == 40.8154
+    assert record.longitude == -73.0451
+    assert table.get("94115") is None
+    assert table.get("not a zip") is None
+
+
+@pytest.mark.django_db
+def test_handle_from_db(zip5_table_path, ia_zip5, ca_zip5):
+    Command().handle()
+    table = Zip5Table.load(zip5_table_path)
+    assert len(table) == 2
+    for zip_obj in [ia_zip5, ca_zip5]:
+        record = table.get(zip_obj.zip5)
+        assert record.state == zip_obj.state
+        assert record.coordinates == zip_obj.coordinates
+
+
+@pytest.mark.django_db
+def test_lookup_zip5_uses_table_and_falls_back_to_db(
+    zip5_table_path, ia_zip5, django_assert_num_queries
+):
+    Command().handle(file=TEST_FILE_PATH)
+    assert get_zip5_table() is not None
+
+    with django_assert_num_queries(0):
+        assert lookup_zip5("00544").state == "NY"
+    with django_assert_num_queries(1):
+        assert lookup_zip5(ia_zip5.zip5).state == "IA"
+    with pytest.raises(USZip5.DoesNotExist):
+        lookup_zip5("99999")
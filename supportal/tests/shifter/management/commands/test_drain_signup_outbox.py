@@ -0,0 +1,162 @@
+import json
+import time
+import unittest
+
+import pytest
+import responses
+from django.core.cache import cache
+from model_bakery import baker
+
+from supportal.services.mobilize_america import (
+    PRIVATE_VISIBILITY,
+    get_global_client,
+)
+from supportal.shifter.management.commands.drain_signup_outbox import Command
+from supportal.shifter.models import EventSignup
+from supportal.shifter.signup_outbox import DRAIN_LOCK_KEY, drain_signup_outbox
+from supportal.tests.services.mock_mobilize_america_responses import (
+    CREATE_ATTENDANCE_RESPONSE,
+)
+
+ATTENDANCES_URL = (
+    "https://localhost:8000/mobilize/v1/organizations/1/events/{}/attendances"
+)
+
+
+def _signup(event_id, **kwargs):
+    kwargs.setdefault("ma_sync_deferred", True)
+    return baker.make(
+        "EventSignup",
+        email="mbanerjee@elizabethwarren.com",
+        zip5="11238",
+        ma_event_id=event_id,
+        ma_timeslot_ids=[1],
+        ma_creation_successful=False,
+        **kwargs,
+    )
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_drain_signup_outbox(settings):
+    settings.SHIFTER_SIGNUP_OUTBOX = True
+    settings.SHIFTER_SIGNUP_OUTBOX_SENDS_PER_SECOND = 0
+    for event_id in [17, 18]:
+        responses.add(
+            responses.GET,
+            ATTENDANCES_URL.format(event_id),
+            body=json.dumps({"data": []}),
+        )
+    responses.add(
+        responses.POST,
+        ATTENDANCES_URL.format(17),
+        body=json.dumps(CREATE_ATTENDANCE_RESPONSE),
+    )
+    responses.add(
+        responses.POST,
+        ATTENDANCES_URL.format(18),
+        body=json.dumps({"error": {"detail": "Timeslot is full"}}),
+        status=400,
+    )
+    sent = [_signup(17), _signup(17)]
+    failed = _signup(18)
+    not_deferred = _signup(17, ma_sync_deferred=False)
+
+    assert Command().handle() == "Sent 2 signups, 1 failed"
+    for signup in sent:
+        signup.refresh_from_db()
+        assert signup.ma_creation_successful
+        assert signup.retried_at is not None
+        assert not signup.ma_sync_deferred
+    failed.refresh_from_db()
+    assert not failed.ma_creation_successful
+    assert failed.retried_at is not None
+    assert not failed.ma_sync_deferred
+    not_deferred.refresh_from_db()
+    assert not_deferred.retried_at is None
+    # one attendance fetch per event
+    assert [c.request.method for c in responses.calls].count("GET") == 2
+
+    # nothing left to send
+    assert Command().handle() == "Sent 0 signups, 0 failed"
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_drain_signup_outbox_never_sends_private_event_signups(api_client, settings):
+    settings.SHIFTER_SIGNUP_OUTBOX = True
+    baker.make("MobilizeAmericaEvent", id=19, raw={}, visibility=PRIVATE_VISIBILITY)
+    res = api_client.post(
+        "/v1/shifter/event_signups",
+        data={
+            "email": "mbanerjee@elizabethwarren.com",
+            "given_name": "",
+            "family_name": "",
+            "zip5": "11238",
+            "ma_event_id": 19,
+            "ma_timeslot_ids": [1],
+        },
+    )
+    assert res.status_code == 404
+    assert not EventSignup.objects.exists()
+
+    assert Command().handle() == "Sent 0 signups, 0 failed"
+    assert len(responses.calls) == 0
+
+
+@pytest.mark.django_db
+def test_drain_signup_outbox_is_off(settings):
+    settings.SHIFTER_SIGNUP_OUTBOX = False
+    signup = _signup(17)
+
+    assert Command().handle() == "Signup outbox is off"
+    signup.refresh_from_db()
+    assert signup.retried_at is None
+
+
+@pytest.mark.django_db
+def test_drain_signup_outbox_stops_while_circuit_is_open(settings):
+    settings.SHIFTER_SIGNUP_OUTBOX = True
+    signup = _signup(17)
+    breaker = get_global_client().circuit_breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    assert Command().handle() == "Sent 0 signups, 0 failed"
+    signup.refresh_from_db()
+    assert signup.retried_at is None
+
+
+@pytest.mark.django_db
+def test_drain_signup_outbox_stops_when_out_of_time(settings):
+    settings.SHIFTER_SIGNUP_OUTBOX_SENDS_PER_SECOND = 0
+    first, second = _signup(17), _signup(18)
+
+    def slow_send(*args):
+        time.sleep(0.05)
+        return True, None
+
+    with unittest.mock.patch.object(
+        EventSignup, "send_to_mobilize_america", side_effect=slow_send
+    ), unittest.mock.patch.object(get_global_client(), "prefetch_event_attendances"):
+        assert drain_signup_outbox(batch_size=1, time_budget=0.01) == (1, 0)
+
+    # the first batch is saved, the second is left for the next drain
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert first.retried_at is not None
+    assert second.retried_at is None
+
+
+@pytest.mark.django_db
+def test_drain_signup_outbox_skips_while_another_drain_runs(settings):
+    settings.SHIFTER_SIGNUP_OUTBOX = True
+    signup = _signup(17)
+    cache.add(DRAIN_LOCK_KEY, True)
+    try:
+        assert Command().handle() == "Another drain is in progress"
+    finally:
+        cache.delete(DRAIN_LOCK_KEY)
+
+    signup.refresh_from_db()
+    assert signup.retried_at is None
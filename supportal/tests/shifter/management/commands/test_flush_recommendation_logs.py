@@ -0,0 +1,51 @@
+import unittest
+
+import pytest
+
+from supportal.shifter.management.commands.flush_recommendation_logs import Command
+from supportal.shifter.models import RecommendedEventRequestLog
+from supportal.shifter.request_log_buffer import (
+    buffer_request_log,
+    flush_request_logs,
+)
+
+
+def _buffer_logs(count):
+    for i in range(count):
+        buffer_request_log(
+            RecommendedEventRequestLog(
+                session_id=f"session-{i}",
+                request_params={"zip5": "11238", "limit": 1},
+                recommended_ma_event_ids=[17, i],
+            )
+        )
+
+
+@pytest.mark.django_db
+def test_handle():
+    _buffer_logs(3)
+    assert RecommendedEventRequestLog.objects.count() == 0
+
+    assert Command().handle(batch_size=2).startswith("Wrote 3 logs")
+    logs = RecommendedEventRequestLog.objects.order_by("session_id")
+    assert [l.session_id for l in logs] == ["session-0", "session-1", "session-2"]
+    assert logs[2].recommended_ma_event_ids == [17, 2]
+    assert logs[2].request_params == {"zip5": "11238", "limit": 1}
+
+    # the buffer was drained
+    assert Command().handle().startswith("Wrote 0 logs")
+    assert RecommendedEventRequestLog.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_flush_stops_when_out_of_time():
+    _buffer_logs(3)
+    with unittest.mock.patch("supportal.shifter.request_log_buffer.time") as mock_time:
+        # the budget is spent after the first batch
+        mock_time.monotonic.side_effect = [0, 0, 100]
+        assert flush_request_logs(batch_size=2, time_budget=10) == 2
+    assert RecommendedEventRequestLog.objects.count() == 2
+
+    # the rest is left for the next flush
+    assert flush_request_logs(batch_size=2) == 1
+    assert RecommendedEventRequestLog.objects.count() == 3
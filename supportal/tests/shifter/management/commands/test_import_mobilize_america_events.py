@@ -9,7 +9,7 @@ from model_bakery import baker
 
 from supportal.services.mobilize_america import EVENT_TYPES
 from supportal.shifter.management.commands.import_mobilize_america_events import Command
-from supportal.shifter.models import MobilizeAmericaEvent
+from supportal.shifter.models import MobilizeAmericaEvent, MobilizeAmericaEventImport
 from supportal.tests.services.mock_mobilize_america_responses import (
     LIST_EVENTS_IA_GOTC_RESPONSE,
     LIST_EVENTS_RESPONSE,
@@ -96,3 +96,119 @@ def test_marks_events_as_active(cambridge_event):
     Command().handle()
     event = MobilizeAmericaEvent.objects.get(id=cambridge_event.id)
     assert event.is_active
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_events_are_deactivated_after_two_missed_full_imports():
+    older_full, previous_full = baker.make(
+        "MobilizeAmericaEventImport",
+        mode=MobilizeAmericaEventImport.FULL,
+        succeeded=True,
+        _quantity=2,
+    )
+    missed_once = baker.make(
+        "MobilizeAmericaEvent", id=1, raw={}, last_seen_generation=previous_full.id
+    )
+    missed_twice = baker.make(
+        "MobilizeAmericaEvent", id=2, raw={}, last_seen_generation=older_full.id
+    )
+    list_events_response = deepcopy(LIST_EVENTS_RESPONSE)
+    list_events_response["next"] = None
+    _add_event_type_response("PUBLIC", list_events_response)
+    _add_event_type_response("PRIVATE", list_events_response)
+
+    Command().handle(full=True)
+    run = MobilizeAmericaEventImport.objects.latest("id")
+    assert run.deactivated_count == 1
+    missed_once.refresh_from_db()
+    missed_twice.refresh_from_db()
+    assert missed_once.is_active
+    assert not missed_twice.is_active
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_incremental_import_after_full_import(cambridge_event):
+    list_events_response = deepcopy(LIST_EVENTS_RESPONSE)
+    list_events_response["next"] = None
+    _add_event_type_response("PUBLIC", list_events_response)
+    _add_event_type_response("PRIVATE", list_events_response)
+    Command().handle()
+    full_run = MobilizeAmericaEventImport.objects.get()
+    assert full_run.mode == MobilizeAmericaEventImport.FULL
+    assert full_run.succeeded
+    assert full_run.deactivated_count == 1
+
+    cambridge_event.is_active = True
+    cambridge_event.save()
+    updated_event = deepcopy(LIST_EVENTS_RESPONSE["data"][0])
+    updated_event["title"] = "Changed title"
+    responses.add(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events",
+        body=json.dumps({"data": [updated_event], "next": None, "count": 1}),
+    )
+    Command().handle()
+
+    incremental_run = MobilizeAmericaEventImport.objects.latest("created_at")
+    assert incremental_run.mode == MobilizeAmericaEventImport.INCREMENTAL
+    assert incremental_run.updated_since < full_run.created_at
+    assert incremental_run.updated_count == 2
+    assert "updated_since=" in responses.calls[-1].request.url
+    assert MobilizeAmericaEvent.objects.get(id=updated_event["id"]).title == (
+        "Changed title"
+    )
+    # only full imports deactivate events
+    cambridge_event.refresh_from_db()
+    assert cambridge_event.is_active
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_full_import_when_sweep_is_due(settings):
+    settings.SHIFTER_EVENT_IMPORT_FULL_SWEEP_SECONDS = 0
+    list_events_response = deepcopy(LIST_EVENTS_RESPONSE)
+    list_events_response["next"] = None
+    _add_event_type_response("PUBLIC", list_events_response)
+    _add_event_type_response("PRIVATE", list_events_response)
+    Command().handle()
+    Command().handle()
+    runs = MobilizeAmericaEventImport.objects.order_by("created_at")
+    assert [r.mode for r in runs] == [
+        MobilizeAmericaEventImport.FULL,
+        MobilizeAmericaEventImport.FULL,
+    ]
+
+
+def _page_of_events(first_id, count, next_url):
+    data = []
+    for event_id in range(first_id, first_id + 3):
+        event = deepcopy(LIST_EVENTS_RESPONSE["data"][0])
+        event["id"] = event_id
+        for i, timeslot in enumerate(event["timeslots"]):
+            timeslot["id"] = event_id * 100 + i
+        data.append(event)
+    return {"count": count, "next": next_url, "data": data}
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_fetches_pages_concurrently():
+    base_url = "https://localhost:8000/mobilize/v1/organizations/1/events"
+    page_url = f"{base_url}?page={{}}&visibility=PUBLIC&timeslot_start=gte_now"
+    _add_event_type_response("PUBLIC", _page_of_events(1, 9, page_url.format(2)))
+    for page in [2, 3]:
+        responses.add(
+            responses.GET,
+            page_url.format(page),
+            # MA's next links don't matter once we know the page count
+            body=json.dumps(_page_of_events(page * 10, 9, "ignored")),
+            match_querystring=True,
+        )
+    _add_event_type_response("PRIVATE", {"count": 0, "next": None, "data": []})
+
+    assert Command().handle() == "Loaded events: 9"
+    event_ids = MobilizeAmericaEvent.objects.values_list("id", flat=True)
+    assert sorted(event_ids) == [1, 2, 3, 20, 21, 22, 30, 31, 32]
+    assert MobilizeAmericaEventImport.objects.get().page_count == 4
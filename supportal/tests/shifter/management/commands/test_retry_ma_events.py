@@ -1,11 +1,17 @@
 import unittest
 
 import pytest
+from django.core.cache import cache
+from django.core.management import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from localflavor.us.models import USZipCodeField
 from model_bakery import baker
 
+from supportal.services.mobilize_america import MobilizeAmericaClient
 from supportal.shifter.management.commands.retry_ma_events import Command
 from supportal.shifter.models import EventSignup
+from supportal.shifter.signup_outbox import DRAIN_LOCK_KEY
 
 
 @pytest.mark.django_db
@@ -14,7 +20,7 @@ def test_retry_ma_events():
     event_2 = baker.make("EventSignup", zip5="94102", ma_creation_successful=True)
 
     with unittest.mock.patch.object(
-        EventSignup, "sync_to_mobilize_america", return_value=(True, None)
+        EventSignup, "send_to_mobilize_america", return_value=(True, None)
     ):
         Command().handle()
 
@@ -23,3 +29,42 @@ def test_retry_ma_events():
 
     assert event_1.retried_at is not None
     assert event_2.retried_at is None
+
+
+@pytest.mark.django_db
+def test_retry_ma_events_updates_in_batches():
+    baker.make(
+        "EventSignup",
+        email="mbanerjee@elizabethwarren.com",
+        zip5="94102",
+        ma_creation_successful=False,
+        ma_event_id=17,
+        _quantity=5,
+    )
+
+    with unittest.mock.patch.object(
+        EventSignup, "send_to_mobilize_america", return_value=(True, None)
+    ), unittest.mock.patch.object(
+        MobilizeAmericaClient, "prefetch_event_attendances"
+    ) as prefetch:
+        with CaptureQueriesContext(connection) as queries:
+            assert Command().handle() == "Resent 5 signups"
+
+    prefetch.assert_called_once_with(17)
+    updates = [q for q in queries.captured_queries if q["sql"].startswith("UPDATE")]
+    assert len(updates) == 1
+    assert EventSignup.objects.filter(retried_at__isnull=True).count() == 0
+
+
+@pytest.mark.django_db
+def test_retry_ma_events_fails_while_outbox_is_draining():
+    event = baker.make("EventSignup", zip5="94102", ma_creation_successful=False)
+    cache.add(DRAIN_LOCK_KEY, True)
+    try:
+        with pytest.raises(CommandError):
+            Command().handle()
+    finally:
+        cache.delete(DRAIN_LOCK_KEY)
+
+    event.refresh_from_db()
+    assert event.retried_at is None
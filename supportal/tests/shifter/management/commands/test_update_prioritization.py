@@ -2,6 +2,9 @@ import os
 import unittest
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
 
 from supportal.shifter.management.commands.update_prioritization import (
     MA_EVENT_ID_COLUMN,
@@ -44,3 +47,31 @@ def test_handle(
         assert cambridge_event.state_prioritization == MAX_INTEGER_SIZE
         assert virtual_phone_bank.state_prioritization == MAX_INTEGER_SIZE
         assert high_pri_virtual_phone_bank.state_prioritization == 5
+
+
+@pytest.mark.django_db
+def test_handle_updates_in_bulk(iowa_state, virtual_phone_bank):
+    stale_event = baker.make(
+        "MobilizeAmericaEvent", id=456, raw={}, state=iowa_state, state_prioritization=3
+    )
+    other_state_event = baker.make(
+        "MobilizeAmericaEvent", id=789, raw={}, state=None, state_prioritization=2
+    )
+    with unittest.mock.patch(
+        "supportal.shifter.management.commands.update_prioritization.GoogleSheetsClient"
+    ) as mock, CaptureQueriesContext(connection) as queries:
+        mock.return_value.get_values_from_sheet.return_value = [
+            {MA_EVENT_ID_COLUMN: virtual_phone_bank.id, PRIORITIZATION_COLUMN: 4}
+        ]
+        Command().handle()
+
+    updates = [q for q in queries if q["sql"].lstrip().startswith("UPDATE")]
+    assert len(updates) == 2
+
+    virtual_phone_bank.refresh_from_db()
+    stale_event.refresh_from_db()
+    other_state_event.refresh_from_db()
+    assert virtual_phone_bank.state_prioritization == 4
+    # events in the state that were dropped from the sheet are reset
+    assert stale_event.state_prioritization == MAX_INTEGER_SIZE
+    assert other_state_event.state_prioritization == 2
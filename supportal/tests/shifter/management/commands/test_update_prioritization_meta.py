@@ -2,6 +2,7 @@ import unittest
 
 import pytest
 
+from supportal.shifter.caching import get_state_prioritization_config
 from supportal.shifter.management.commands.update_prioritization_meta import (
     PRIORITIZATION_DOC_URL_COLUMN_NAME,
     STATE_CODE_COLUMN_NAME,
@@ -40,6 +41,7 @@ def test_handle():
         assert hawaii_state.use_prioritization_doc is False
         assert california_state.use_prioritization_doc is False
         assert ri_state.use_prioritization_doc is False
+        assert get_state_prioritization_config().doc_prio_states == frozenset()
 
         Command().handle()
 
@@ -54,3 +56,5 @@ def test_handle():
         assert hawaii_state.prioritization_doc == "woot"
         assert california_state.prioritization_doc == ""
         assert ri_state.prioritization_doc == "woot"
+
+        assert get_state_prioritization_config().doc_prio_states == frozenset(["RI"])
@@ -0,0 +1,103 @@
+import unittest
+import uuid
+
+import pytest
+from django.core.cache import cache
+
+from supportal.shifter.caching import (
+    bump_event_cache_generation,
+    get_stale_while_revalidate,
+    ma_events_cache_key,
+)
+
+
+def _counting_fetch(*values):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return values[len(calls) - 1]
+
+    return fetch, calls
+
+
+def test_stale_while_revalidate_serves_fresh_values_from_cache():
+    key = f"test-swr-{uuid.uuid4()}"
+    fetch, calls = _counting_fetch("first", "second")
+    assert get_stale_while_revalidate(key, fetch, fresh_for=60, stale_for=60) == "first"
+    assert get_stale_while_revalidate(key, fetch, fresh_for=60, stale_for=60) == "first"
+    assert len(calls) == 1
+
+
+def test_stale_while_revalidate_refreshes_stale_values():
+    key = f"test-swr-{uuid.uuid4()}"
+    fetch, calls = _counting_fetch("first", "second")
+    assert get_stale_while_revalidate(key, fetch, fresh_for=60, stale_for=60) == "first"
+    # the first request to see a stale value refreshes it
+    assert (
+        get_stale_while_revalidate(key, fetch, fresh_for=-1, stale_for=60) == "second"
+    )
+    assert len(calls) == 2
+    assert (
+        get_stale_while_revalidate(key, fetch, fresh_for=60, stale_for=60) == "second"
+    )
+
+
+def test_stale_while_revalidate_serves_stale_values_during_a_refresh():
+    key = f"test-swr-{uuid.uuid4()}"
+    fetch, calls = _counting_fetch("first", "second")
+    get_stale_while_revalidate(key, fetch, fresh_for=60, stale_for=60)
+    # another request is refreshing the value
+    cache.add(f"{key}:refresh_lock", True, 60)
+    assert get_stale_while_revalidate(key, fetch, fresh_for=-1, stale_for=60) == "first"
+    assert len(calls) == 1
+
+
+def test_stale_while_revalidate_serves_stale_values_if_the_refresh_fails():
+    key = f"test-swr-{uuid.uuid4()}"
+    get_stale_while_revalidate(key, lambda: "first", fresh_for=60, stale_for=60)
+
+    def failing_fetch():
+        raise ValueError("nope")
+
+    assert (
+        get_stale_while_revalidate(key, failing_fetch, fresh_for=-1, stale_for=60)
+        == "first"
+    )
+
+
+def test_stale_while_revalidate_does_not_cache_errors():
+    key = f"test-swr-{uuid.uuid4()}"
+
+    def failing_fetch():
+        raise ValueError("nope")
+
+    with pytest.raises(ValueError):
+        get_stale_while_revalidate(key, failing_fetch, fresh_for=60, stale_for=60)
+    assert (
+        get_stale_while_revalidate(key, lambda: "ok", fresh_for=60, stale_for=60)
+        == "ok"
+    )
+
+
+def test_stale_while_revalidate_does_not_wait_without_a_leader():
+    key = f"test-swr-{uuid.uuid4()}"
+    fetch, calls = _counting_fetch("first")
+    # add() fails without anyone holding the lock when the cache is unavailable
+    with unittest.mock.patch(
+        "supportal.shifter.caching.cache.add", return_value=None
+    ), unittest.mock.patch(
+        "supportal.coalescing.time.sleep", side_effect=AssertionError
+    ):
+        assert (
+            get_stale_while_revalidate(key, fetch, fresh_for=60, stale_for=60)
+            == "first"
+        )
+    assert len(calls) == 1
+
+
+def test_ma_events_cache_key_survives_event_imports():
+    params = {"zipcode": "11238", "max_dist": 50}
+    ma_key = ma_events_cache_key(params)
+    bump_event_cache_generation()
+    assert ma_events_cache_key(params) == ma_key
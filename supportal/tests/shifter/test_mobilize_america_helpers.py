@@ -0,0 +1,92 @@
+import datetime
+from copy import deepcopy
+
+import pytest
+
+from supportal.shifter.mobilize_america_helpers import (
+    prepare_event_for_mdata,
+    sanitize_event_payload,
+)
+from supportal.tests.services.mock_mobilize_america_responses import (
+    LIST_EVENTS_IA_GOTC_RESPONSE,
+    LIST_EVENTS_RESPONSE,
+    PRIVATE_ADDRESS_EVENT,
+)
+from supportal.tests.shifter.event_preparation_benchmark import (
+    legacy_prepare_events,
+    run_benchmark,
+    synthetic_events,
+)
+
+ALL_EVENTS = (
+    LIST_EVENTS_IA_GOTC_RESPONSE["data"]
+    + LIST_EVENTS_RESPONSE["data"]
+    + PRIVATE_ADDRESS_EVENT["data"]
+)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "timeslot_start,timeslot_end",
+    [
+        (None, None),
+        (
+            datetime.datetime(2020, 1, 11, 16, 0, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2020, 1, 12, 23, 0, tzinfo=datetime.timezone.utc),
+        ),
+    ],
+)
+@pytest.mark.parametrize("utm_source", [None, "SMS"])
+def test_prepare_event_for_mdata_matches_legacy_pipeline(
+    timeslot_start, timeslot_end, utm_source, sf_zip5
+):
+    events = deepcopy(ALL_EVENTS)
+    events[0]["timeslots"][0]["is_full"] = True
+    prepared = [
+        prepare_event_for_mdata(e, utm_source, timeslot_start, timeslot_end)
+        for e in events
+    ]
+    assert [e for e in prepared if e is not None] == legacy_prepare_events(
+        events, utm_source, timeslot_start, timeslot_end
+    )
+
+
+@pytest.mark.django_db
+def test_event_preparation_benchmark():
+    res = run_benchmark(synthetic_events(5, 30), iterations=1)
+    assert res.startswith("Identical output for 5 events")
+
+
+def test_prepare_event_for_mdata_does_not_modify_raw_event():
+    event = deepcopy(LIST_EVENTS_IA_GOTC_RESPONSE["data"][0])
+    prepare_event_for_mdata(event, "SMS")
+    assert event == LIST_EVENTS_IA_GOTC_RESPONSE["data"][0]
+
+
+def test_prepare_event_for_mdata_without_open_timeslots():
+    event = deepcopy(LIST_EVENTS_IA_GOTC_RESPONSE["data"][0])
+    for timeslot in event["timeslots"]:
+        timeslot["is_full"] = True
+    assert prepare_event_for_mdata(event, "SMS") is None
+
+
+@pytest.mark.django_db
+def test_sanitize_event_payload_private_address(sf_zip5, django_assert_num_queries):
+    event = PRIVATE_ADDRESS_EVENT["data"][0]
+    with django_assert_num_queries(1):
+        sanitized = sanitize_event_payload(event)
+        assert sanitize_event_payload(event) == sanitized
+    assert sanitized["location"] == {
+        "location": {"latitude": 37.786, "longitude": -122.4373}
+    }
+
+
+@pytest.mark.django_db
+def test_sanitize_event_payload_private_address_unknown_zip(
+    django_assert_num_queries,
+):
+    event = deepcopy(PRIVATE_ADDRESS_EVENT["data"][0])
+    event["location"]["postal_code"] = "00000"
+    with django_assert_num_queries(1):
+        assert "location" not in sanitize_event_payload(event)
+        assert "location" not in sanitize_event_payload(event)
@@ -10,10 +10,13 @@ from django.contrib.gis.geos import Point
 from supportal.shifter.models import (
     EventSignup,
     MobilizeAmericaEvent,
+    MobilizeAmericaTimeslot,
     RecommendedEventRequestLog,
+    payload_content_hash,
 )
 from supportal.tests.services.mock_mobilize_america_responses import (
     CREATE_ATTENDANCE_RESPONSE,
+    LIST_EVENTS_IA_GOTC_RESPONSE,
     LIST_EVENTS_RESPONSE,
 )
 
@@ -125,6 +128,17 @@ def test_update_and_create_mobilize_america_event_from_json(ca_zip5):
     )
 
 
+@pytest.mark.django_db
+def test_update_or_create_from_json_stamps_the_import():
+    payload = deepcopy(LIST_EVENTS_RESPONSE["data"][0])
+    ma_event, created = MobilizeAmericaEvent.objects.update_or_create_from_json(
+        payload, generation=7
+    )
+    assert created
+    assert ma_event.last_seen_generation == 7
+    assert ma_event.content_hash == payload_content_hash(payload)
+
+
 @pytest.mark.django_db
 def test_create_update_delete_timeslot():
     payload = deepcopy(LIST_EVENTS_RESPONSE["data"][0])
@@ -155,3 +169,90 @@ def test_create_update_delete_timeslot():
     ma_event, _ = MobilizeAmericaEvent.objects.update_or_create_from_json(payload)
     ts = ma_event.timeslots.filter(id=updated_timeslot_id).first()
     assert __same_ts(ts.start_date, new_start_date)
+
+
+@pytest.mark.django_db
+def test_bulk_upsert_from_json(ca_zip5):
+    payloads = deepcopy(LIST_EVENTS_RESPONSE["data"])
+    payloads[0]["location"]["region"] = ca_zip5.state
+    created, updated = MobilizeAmericaEvent.objects.bulk_upsert_from_json(payloads)
+    assert set(created) == {p["id"] for p in payloads}
+    assert updated == []
+    ma_event = MobilizeAmericaEvent.objects.get(id=payloads[0]["id"])
+    __check_ma_event_matches_payload(
+        ma_event, payloads[0], virtual_expected=False, state_expected=ca_zip5.state
+    )
+    ma_event.state_prioritization = 1
+    ma_event.is_active = False
+    ma_event.save()
+
+    payload = payloads[0]
+    del payload["location"]
+    payload["title"] = "Changed title"
+    payload["timeslots"][0]["start_date"] = 1
+    removed_timeslot_id = payload["timeslots"].pop()["id"]
+    payload["timeslots"].append(
+        {"id": 123456789, "start_date": 123, "end_date": 456, "is_full": False}
+    )
+    created, updated = MobilizeAmericaEvent.objects.bulk_upsert_from_json([payload])
+    assert created == []
+    assert updated == [payload["id"]]
+    ma_event.refresh_from_db()
+    __check_ma_event_matches_payload(
+        ma_event, payload, virtual_expected=True, state_expected=None
+    )
+    assert ma_event.is_active
+    # not owned by the import
+    assert ma_event.state_prioritization == 1
+    assert {ts.id for ts in ma_event.timeslots.all()} == {
+        ts["id"] for ts in payload["timeslots"]
+    }
+    assert not MobilizeAmericaTimeslot.objects.filter(id=removed_timeslot_id).exists()
+
+
+@pytest.mark.django_db
+def test_bulk_upsert_from_json_skips_unchanged_rows(django_assert_num_queries):
+    payloads = deepcopy(LIST_EVENTS_RESPONSE["data"])
+    state_ids_by_code = MobilizeAmericaEvent.objects.state_ids_by_code()
+    MobilizeAmericaEvent.objects.bulk_upsert_from_json(
+        payloads, state_ids_by_code, generation=1
+    )
+    ma_event = MobilizeAmericaEvent.objects.get(id=payloads[0]["id"])
+    assert ma_event.last_seen_generation == 1
+
+    # savepoint, content hash select, generation update, release savepoint
+    with django_assert_num_queries(4):
+        assert MobilizeAmericaEvent.objects.bulk_upsert_from_json(
+            payloads, state_ids_by_code, generation=2
+        ) == ([], [])
+    ma_event.refresh_from_db()
+    assert ma_event.last_seen_generation == 2
+
+    # only the event is written, its timeslots didn't change
+    payloads[0]["title"] = "Changed title"
+    with django_assert_num_queries(6):
+        assert MobilizeAmericaEvent.objects.bulk_upsert_from_json(
+            payloads, state_ids_by_code, generation=3
+        ) == ([], [payloads[0]["id"]])
+    ma_event.refresh_from_db()
+    assert ma_event.last_seen_generation == 3
+
+
+@pytest.mark.django_db
+def test_mdata_display_fields_are_precomputed():
+    payload = deepcopy(LIST_EVENTS_IA_GOTC_RESPONSE["data"][0])
+    ma_event, _ = MobilizeAmericaEvent.objects.update_or_create_from_json(payload)
+    assert (
+        ma_event.times_synopsis
+        == "9AM, 12PM, 3PM, or 6PM on Sat Jan 11; or 12PM, 3PM, or 6PM on Sun Jan 12"
+    )
+    first_timeslot = ma_event.timeslots.get(id=payload["timeslots"][0]["id"])
+    assert first_timeslot.local_start_time == "2020-01-11T09:00:00"
+    assert first_timeslot.formatted_time == "Sat Jan 11 at 9:00 AM"
+
+    served = ma_event.raw_with_display_fields()
+    assert served["times_synopsis"] == ma_event.times_synopsis
+    assert served["timeslots"][0]["local_start_time"] == "2020-01-11T09:00:00"
+    # the stored payload itself is left untouched
+    ma_event.refresh_from_db()
+    assert ma_event.raw == payload
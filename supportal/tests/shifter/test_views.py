@@ -9,8 +9,15 @@ from django.utils import timezone
 from model_bakery import baker
 
 from supportal.services.mobilize_america import PRIVATE_VISIBILITY, PUBLIC_VISIBILITY
+from supportal.shifter.caching import bump_event_cache_generation, record_event_import
 from supportal.shifter.common.error_codes import ErrorCodes
-from supportal.shifter.models import EventSignup, MobilizeAmericaEvent, State
+from supportal.shifter.models import (
+    EventSignup,
+    MobilizeAmericaEvent,
+    RecommendedEventRequestLog,
+    State,
+    USZip5,
+)
 from supportal.tests.services.mock_mobilize_america_responses import (
     CREATE_ATTENDANCE_RESPONSE,
     LIST_EVENTS_IA_GOTC_RESPONSE,
@@ -93,6 +100,22 @@ def test_post_event_signup(api_client):
     assert EventSignup.objects.get(session_id="abcdef").heap_id
 
 
+@pytest.mark.django_db
+@responses.activate
+def test_post_event_signup_outbox(api_client, settings):
+    settings.SHIFTER_SIGNUP_OUTBOX = True
+    _setup_event_attendance_mocks(event_id=17)
+    res = api_client.post(
+        "/v1/shifter/event_signups", data=_event_signup_payload("abcdef", event_id=17)
+    )
+    assert res.status_code == 201
+    assert len(responses.calls) == 0
+    signup = EventSignup.objects.get(session_id="abcdef")
+    assert not signup.ma_creation_successful
+    assert signup.ma_response is None
+    assert signup.ma_sync_deferred
+
+
 @pytest.mark.django_db
 @responses.activate
 def test_post_event_signup_invalid_data(api_client):
@@ -321,6 +344,99 @@ def test_get_event_goes_to_ma_and404s(api_client):
     assert res.data["detail"] == "Not found."
 
 
+@pytest.mark.django_db
+@responses.activate
+def test_get_event_not_found_is_cached(api_client):
+    responses.add(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events/17",
+        body=json.dumps({"error": {"detail": "Not found."}}),
+        status=404,
+    )
+
+    assert api_client.get(f"/v1/shifter/events/17").status_code == 404
+    assert api_client.get(f"/v1/shifter/events/17").status_code == 404
+    assert len(responses.calls) == 1
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_get_events_batch(api_client, cambridge_event):
+    responses.add(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events/17",
+        body=json.dumps({"data": LIST_EVENTS_RESPONSE["data"][0]}),
+    )
+    responses.add(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events/18",
+        body=json.dumps({"error": {"detail": "Not found."}}),
+        status=404,
+    )
+
+    url = f"/v1/shifter/events?ids={cambridge_event.id},17,18,17"
+    res = api_client.get(url)
+    assert res.status_code == 200
+    assert res.data["count"] == 2
+    assert list(res.data["data"]) == [str(cambridge_event.id), "17"]
+    assert res.data["data"]["17"]["id"] == LIST_EVENTS_RESPONSE["data"][0]["id"]
+    assert res.data["errors"]["18"]["detail"] == "Not found."
+    assert res.data["errors"]["18"]["status_code"] == 404
+    assert len(responses.calls) == 2
+
+    # Everything, including the 404, is cached now
+    assert api_client.get(url).data == res.data
+    assert len(responses.calls) == 2
+
+
+@pytest.mark.django_db
+def test_get_events_batch_invalid_ids(api_client, settings):
+    settings.SHIFTER_EVENT_BATCH_MAX_IDS = 2
+    for url in [
+        "/v1/shifter/events",
+        "/v1/shifter/events?ids=1,badid",
+        "/v1/shifter/events?ids=1,2,3",
+    ]:
+        res = api_client.get(url)
+        assert res.status_code == 400
+        assert res.data["code"] == ErrorCodes.INVALID_EVENT_ID.name
+
+
+@pytest.mark.django_db
+def test_get_event_is_cached_with_etag(api_client, cambridge_event):
+    res = api_client.get(f"/v1/shifter/events/{cambridge_event.id}")
+    assert res.status_code == 200
+    etag = res["ETag"]
+    assert res["Cache-Control"] == "public, max-age=60"
+
+    res = api_client.get(
+        f"/v1/shifter/events/{cambridge_event.id}", HTTP_IF_NONE_MATCH=etag
+    )
+    assert res.status_code == 304
+    assert res["ETag"] == etag
+
+    res = api_client.get(
+        f"/v1/shifter/events/{cambridge_event.id}", HTTP_IF_NONE_MATCH='"other"'
+    )
+    assert res.status_code == 200
+
+    # Cached until the next import
+    raw = deepcopy(cambridge_event.raw)
+    raw["title"] = "New title"
+    cambridge_event.raw = raw
+    cambridge_event.save()
+    res = api_client.get(f"/v1/shifter/events/{cambridge_event.id}")
+    assert res.data["title"] != "New title"
+
+    bump_event_cache_generation()
+    res = api_client.get(
+        f"/v1/shifter/events/{cambridge_event.id}", HTTP_IF_NONE_MATCH=etag
+    )
+    assert res.status_code == 200
+    assert res.data["title"] == "New title"
+    assert res["ETag"] != etag
+
+
 @pytest.mark.django_db
 def test_get_event_invalid_data(api_client):
     res = api_client.get(f"/v1/shifter/events/badid")
@@ -350,7 +466,7 @@ def test_get_event(api_client, cambridge_event):
 
 
 @pytest.mark.django_db
-def test_get_event_private_address(api_client, cambridge_event):
+def test_get_event_private_address(api_client, cambridge_event, sf_zip5):
     cambridge_event.raw = PRIVATE_ADDRESS_EVENT["data"][0]
     cambridge_event.save()
     start_date = datetime.datetime(2019, 9, 12, 15, 0, 0, tzinfo=timezone.utc)
@@ -412,6 +528,29 @@ def test_get_ia_gotc_event_recommendations(api_client):
     )
 
 
+@pytest.mark.django_db
+@responses.activate
+def test_event_recommendations_are_cached(api_client):
+    responses.add(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events?visibility=PUBLIC&timeslot_start=gte_now&tag_id=34&tag_id=35&event_types=CANVASS&zipcode=11238&max_dist=50",
+        json=LIST_EVENTS_IA_GOTC_RESPONSE,
+    )
+    url = "/v1/shifter/recommended_events?zip5=11238&event_types=CANVASS&max_dist=50&utm_source=SMS&limit=1&strategy=mobilize_america"
+    check_results_ia_gotc_result(api_client.get(f"{url}&tag_ids=34,35"))
+    # equivalent parameters in a different order hit the cache
+    check_results_ia_gotc_result(api_client.get(f"{url}&tag_ids=35,34,34"))
+    assert len(responses.calls) == 1
+    # every request is still logged
+    logs = list(RecommendedEventRequestLog.objects.all())
+    assert len(logs) == 2
+    assert logs[0].recommended_ma_event_ids == logs[1].recommended_ma_event_ids
+
+    bump_event_cache_generation()
+    check_results_ia_gotc_result(api_client.get(f"{url}&tag_ids=34,35"))
+    assert len(responses.calls) == 2
+
+
 @pytest.mark.django_db
 @responses.activate
 def test_non_zip(api_client):
@@ -713,6 +852,42 @@ def test_get_ia_gotc_event_recommendation_db_strategy(api_client, ia_zip5):
     )
 
 
+@pytest.mark.django_db
+@responses.activate
+def test_get_ia_gotc_event_recommendation_hybrid_strategy_uses_db(
+    api_client, ia_zip5
+):
+    for event_json in LIST_EVENTS_IA_GOTC_RESPONSE["data"]:
+        MobilizeAmericaEvent.objects.update_or_create_from_json(event_json)
+    record_event_import()
+
+    check_results_ia_gotc_result(
+        api_client.get(
+            f"/v1/shifter/recommended_events?zip5={ia_zip5.zip5}&event_types=CANVASS&tag_ids=34,35&max_dist=500&utm_source=SMS&limit=1&timeslot_start=2020-01-01T00:00:01Z"
+        )
+    )
+    assert len(responses.calls) == 0
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_get_ia_gotc_event_recommendation_hybrid_strategy_falls_back_to_ma(
+    api_client, ia_zip5
+):
+    record_event_import()
+    responses.add(
+        responses.GET,
+        "https://localhost:8000/mobilize/v1/organizations/1/events?visibility=PUBLIC&timeslot_start=gte_now&tag_id=34&tag_id=35&event_types=CANVASS&zipcode=52240&max_dist=50",
+        json=LIST_EVENTS_IA_GOTC_RESPONSE,
+    )
+    check_results_ia_gotc_result(
+        api_client.get(
+            f"/v1/shifter/recommended_events?zip5={ia_zip5.zip5}&event_types=CANVASS&tag_ids=34,35&max_dist=50&utm_source=SMS&limit=1"
+        )
+    )
+    assert len(responses.calls) == 1
+
+
 @pytest.mark.django_db
 def test_zip5_validation(api_client):
     res = api_client.get(
@@ -792,6 +967,25 @@ def test_early_states_ma(
     }
 
 
+@pytest.mark.django_db
+def test_early_states_precomputed_matches_live(
+    api_client, ia_zip5, nh_zip5, nv_zip5, sc_zip5, ma_zip5, ca_zip5
+):
+    urls = [
+        f"/v1/shifter/early_states?zip5={ca_zip5.zip5}",
+        f"/v1/shifter/early_states?zip5={ca_zip5.zip5}&max_dist=100",
+        f"/v1/shifter/early_states?zip5={ia_zip5.zip5}&max_dist=25",
+        f"/v1/shifter/early_states?zip5={ma_zip5.zip5}",
+        f"/v1/shifter/early_states?zip5={ma_zip5.zip5}&max_dist=1000",
+    ]
+    live_responses = [api_client.get(url).data for url in urls]
+
+    USZip5.update_early_state_distances()
+    ma_zip5.refresh_from_db()
+    assert set(ma_zip5.early_state_distances) == {"IA", "NH", "NV", "SC"}
+    assert [api_client.get(url).data for url in urls] == live_responses
+
+
 @pytest.mark.django_db
 def test_get_us_zip5(api_client, ia_zip5):
     res = api_client.get(f"/v1/shifter/zip5s/{ia_zip5.zip5}")
@@ -0,0 +1,72 @@
+import time
+import unittest
+import uuid
+
+import pytest
+from django.core.cache import cache
+
+from supportal.coalescing import fetch_coalesced, store
+
+
+def _counting_fetch(value):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return value
+
+    return fetch, calls
+
+
+def test_fetch_coalesced_caches_the_result():
+    key = f"test-coalesce-{uuid.uuid4()}"
+    fetch, calls = _counting_fetch("first")
+
+    assert fetch_coalesced(key, fetch, 60) == "first"
+    assert cache.get(key)["value"] == "first"
+    assert cache.get(f"{key}:lock") is None
+    assert len(calls) == 1
+
+
+def test_fetch_coalesced_waits_for_the_leader():
+    key = f"test-coalesce-{uuid.uuid4()}"
+    fetch, calls = _counting_fetch("mine")
+    cache.add(f"{key}:lock", True)
+
+    def leader_finishes(seconds):
+        store(key, "theirs", 60)
+        cache.delete(f"{key}:lock")
+
+    with unittest.mock.patch(
+        "supportal.coalescing.time.sleep", side_effect=leader_finishes
+    ):
+        assert fetch_coalesced(key, fetch, 60) == "theirs"
+    assert len(calls) == 0
+
+
+def test_fetch_coalesced_newer_only_ignores_older_results():
+    key = f"test-coalesce-{uuid.uuid4()}"
+    fetch, calls = _counting_fetch("mine")
+    cache.set(key, {"fetched_at": time.time() - 10, "value": "old"})
+    cache.add(f"{key}:lock", True)
+
+    def leader_fails(seconds):
+        cache.delete(f"{key}:lock")
+
+    with unittest.mock.patch(
+        "supportal.coalescing.time.sleep", side_effect=leader_fails
+    ):
+        assert fetch_coalesced(key, fetch, 60, newer_only=True) == "mine"
+    assert len(calls) == 1
+
+
+def test_fetch_coalesced_does_not_share_errors():
+    key = f"test-coalesce-{uuid.uuid4()}"
+
+    def failing_fetch():
+        raise ValueError("nope")
+
+    with pytest.raises(ValueError):
+        fetch_coalesced(key, failing_fetch, 60)
+    assert cache.get(key) is None
+    assert fetch_coalesced(key, lambda: "ok", 60) == "ok"
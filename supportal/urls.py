@@ -34,6 +34,7 @@ from supportal.docs import documentation_urls
 from supportal.shifter.views import (
     EarlyStateView,
     EventSignupView,
+    MobilizeAmericaEventBatchView,
     MobilizeAmericaEventView,
     RecommendedEventView,
     USZip5View,
@@ -67,6 +68,7 @@ app_urls = router.urls + [
 shifter_urls = [
     path("event_signups", EventSignupView.as_view()),
     path("early_states", EarlyStateView.as_view()),
+    path("events", MobilizeAmericaEventBatchView.as_view()),
     path("events/<id>", MobilizeAmericaEventView.as_view()),
     path("recommended_events", RecommendedEventView.as_view()),
     re_path("^zip5s/(?P<zip5>\d+)$", USZip5View.as_view()),